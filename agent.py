@@ -1,7 +1,18 @@
 from typing import Optional, Dict, Any
 from enum import Enum
 from abc import ABC, abstractmethod
+import itertools
 import json
+import threading
+import time
+import weakref
+
+from text_store import text_store
+
+
+# Versões globalmente crescentes: um agente recriado com o mesmo nome nunca
+# repete a versão de um anterior (usadas como ETag em app.py)
+_versions = itertools.count(1)
 
 
 class AgentMode(str, Enum):
@@ -21,20 +32,74 @@ class AgentResponse:
 
     def to_dict(self):
         return {
-            "mode": self.mode.value,
+            # Modos registrados em modes.py são strings, os nativos AgentMode
+            "mode": getattr(self.mode, "value", self.mode),
             "prompt": self.prompt,
             "response": self.response,
             "metadata": self.metadata
         }
 
 
+def _release_history(history: list):
+    for entry in history:
+        text_store.release(entry["prompt"])
+        text_store.release(entry["response"])
+
+
 class BaseAgent(ABC):
-    """Classe base para agentes"""
+    """
+    Classe base para agentes
+
+    O histórico é protegido por um lock por agente: chamadas concorrentes
+    no mesmo agente são serializadas apenas na escrita do histórico,
+    enquanto agentes diferentes seguem em paralelo.
+    """
+
+    # Ajustes aceitos por update_settings
+    SETTINGS_KEYS = ("model", "backend", "temperature", "max_tokens", "max_history")
     
     def __init__(self, name: str, description: str = ""):
         self.name = name
         self.description = description
         self.conversation_history = []
+        self._lock = threading.RLock()
+        # Agentes descartados sem clear_history também liberam seus textos
+        weakref.finalize(self, _release_history, self.conversation_history)
+        # Ajustes por agente: model, backend, temperature, max_tokens, max_history
+        self.settings: Dict[str, Any] = {}
+        # Muda a cada alteração do histórico ou dos ajustes
+        self.version = next(_versions)
+        # Último acesso pela API (agentes mais recentes são persistidos no encerramento)
+        self.last_used = time.time()
+
+    def _touch(self):
+        self.version = next(_versions)
+
+    def update_settings(self, **settings):
+        """
+        Atualiza os ajustes do agente (valores None removem o ajuste)
+
+        Raises:
+            ValueError: para chaves desconhecidas
+        """
+        unknown = [key for key in settings if key not in self.SETTINGS_KEYS]
+        if unknown:
+            raise ValueError(f"Ajustes desconhecidos: {', '.join(unknown)}")
+        with self._lock:
+            for key, value in settings.items():
+                if value is None:
+                    self.settings.pop(key, None)
+                else:
+                    self.settings[key] = value
+            self._trim_history()
+            self._touch()
+
+    def _trim_history(self):
+        max_history = self.settings.get("max_history")
+        if max_history is not None and len(self.conversation_history) > max_history:
+            removed = len(self.conversation_history) - max_history
+            _release_history(self.conversation_history[:removed])
+            del self.conversation_history[:removed]
 
     @abstractmethod
     def ask(self, prompt: str) -> AgentResponse:
@@ -60,21 +125,118 @@ class BaseAgent(ABC):
         """
         pass
 
-    def add_to_history(self, mode: AgentMode, prompt: str, response: str):
-        """Adiciona à história de conversação"""
-        self.conversation_history.append({
-            "mode": mode.value,
-            "prompt": prompt,
-            "response": response
-        })
+    def run(self, mode: AgentMode, prompt: str, context: Optional[str] = None,
+            goals: Optional[list] = None) -> AgentResponse:
+        """Executa o modo indicado, repassando apenas os parâmetros que ele usa"""
+        mode = AgentMode(mode)
+        if mode == AgentMode.STUDY:
+            return self.study(prompt, context)
+        if mode == AgentMode.PLAN:
+            return self.plan(prompt, goals)
+        return self.ask(prompt)
+
+    def stream(self, mode: AgentMode, prompt: str, context: Optional[str] = None,
+               goals: Optional[list] = None, on_chunk=None, spec=None) -> AgentResponse:
+        """
+        Executa o modo (ou o modo registrado spec) repassando a resposta para on_chunk
+        Agentes sem streaming entregam a resposta inteira em um pedaço.
+        """
+        if spec is not None:
+            agent_response = self.run_custom(spec, prompt, context, goals)
+        else:
+            agent_response = self.run(mode, prompt, context, goals)
+        if on_chunk is not None:
+            on_chunk(agent_response.response)
+        return agent_response
+
+    def run_custom(self, spec, prompt: str, context: Optional[str] = None,
+                   goals: Optional[list] = None) -> AgentResponse:
+        """
+        Executa um modo registrado (modes.ModeSpec)
+        Por padrão responde com o template do modo aplicado à requisição.
+        """
+        response_text = spec.render(prompt, context, goals)
+        agent_response = AgentResponse(
+            mode=spec.name,
+            prompt=prompt,
+            response=response_text,
+            metadata={"custom_mode": True}
+        )
+        self.add_to_history(spec.name, prompt, response_text)
+        return agent_response
+
+    def add_to_history(self, mode: AgentMode, prompt: str, response: str, provisional: bool = False,
+                       timestamp: Optional[float] = None) -> dict:
+        """
+        Adiciona à história de conversação
+        Prompt e resposta são compartilhados via text_store entre entradas
+        iguais. Retorna a entrada criada, que pode ser substituída depois
+        por replace_history_entry (ex.: resposta provisória refinada).
+        """
+        entry = {
+            "mode": getattr(mode, "value", mode),
+            "prompt": text_store.intern(prompt),
+            "response": text_store.intern(response)
+        }
+        if provisional:
+            entry["provisional"] = True
+        with self._lock:
+            # Atribuído sob o lock: a ordem dos timestamps segue a do histórico,
+            # o que permite exportações incrementais por marca d'água
+            entry["timestamp"] = timestamp if timestamp is not None else time.time()
+            self.conversation_history.append(entry)
+            self._trim_history()
+            self._touch()
+        return entry
+
+    def replace_history_entry(self, entry: dict, response: str) -> Optional[dict]:
+        """
+        Substitui a resposta de uma entrada do histórico (mantendo a posição)
+        A entrada recebe um novo timestamp, para que a próxima exportação
+        incremental (marca d'água) inclua a versão substituída.
+        Retorna a nova entrada, ou None se a entrada não existe mais (ex.:
+        histórico limpo).
+        """
+        with self._lock:
+            for i, existing in enumerate(self.conversation_history):
+                if existing is entry:
+                    text_store.release(entry["response"])
+                    replacement = {
+                        "mode": entry["mode"],
+                        "prompt": entry["prompt"],
+                        "response": text_store.intern(response),
+                        "timestamp": time.time()
+                    }
+                    self.conversation_history[i] = replacement
+                    self._touch()
+                    return replacement
+        return None
+
+    def discard_history_entry(self, entry: dict) -> bool:
+        """
+        Remove uma entrada do histórico (ex.: provisória cujo refinamento não ocorreu)
+        Retorna False se a entrada não existe mais.
+        """
+        with self._lock:
+            for i, existing in enumerate(self.conversation_history):
+                if existing is entry:
+                    _release_history([entry])
+                    del self.conversation_history[i]
+                    self._touch()
+                    return True
+        return False
 
     def get_history(self) -> list:
-        """Retorna histórico de conversações"""
-        return self.conversation_history
+        """Retorna uma cópia do histórico de conversações"""
+        with self._lock:
+            return list(self.conversation_history)
 
     def clear_history(self):
         """Limpa o histórico"""
-        self.conversation_history = []
+        with self._lock:
+            _release_history(self.conversation_history)
+            self.conversation_history.clear()
+            self._touch()
 
 
 class SimpleAgent(BaseAgent):
@@ -110,10 +272,9 @@ class SimpleAgent(BaseAgent):
         self.add_to_history(AgentMode.ASK, prompt, response_text)
         return agent_response
 
-    def study(self, prompt: str, context: Optional[str] = None) -> AgentResponse:
-        """
-        Modo STUDY: Análise profunda
-        """
+    @staticmethod
+    def render_study(prompt: str, context: Optional[str] = None) -> str:
+        """Estrutura da análise (CONTEXTO/ANÁLISE/EXEMPLOS/CONCLUSÕES)"""
         response_text = f"Análise profunda sobre: {prompt}\n\n"
         response_text += "1. CONTEXTO:\n   - Este é um tópico importante para compreensão.\n\n"
         response_text += "2. ANÁLISE DETALHADA:\n   - Primeiro aspecto: Explicação detalhada.\n   - Segundo aspecto: Insights relevantes.\n\n"
@@ -122,21 +283,11 @@ class SimpleAgent(BaseAgent):
         
         if context:
             response_text += f"\n\nCONTEXTO FORNECIDO: {context}"
-        
-        agent_response = AgentResponse(
-            mode=AgentMode.STUDY,
-            prompt=prompt,
-            response=response_text,
-            metadata={"depth": "detailed", "context_provided": context is not None}
-        )
-        
-        self.add_to_history(AgentMode.STUDY, prompt, response_text)
-        return agent_response
+        return response_text
 
-    def plan(self, prompt: str, goals: Optional[list] = None) -> AgentResponse:
-        """
-        Modo PLAN: Criação de plano
-        """
+    @staticmethod
+    def render_plan(prompt: str, goals: Optional[list] = None) -> str:
+        """Estrutura do plano (OBJETIVO/METAS/PASSOS/TIMELINE)"""
         response_text = f"Plano de ação para: {prompt}\n\n"
         response_text += "OBJETIVO PRINCIPAL:\n   - " + prompt + "\n\n"
         
@@ -156,6 +307,29 @@ class SimpleAgent(BaseAgent):
         response_text += "   - Curto prazo: 1-2 semanas\n"
         response_text += "   - Médio prazo: 1-3 meses\n"
         response_text += "   - Longo prazo: 3-6 meses"
+        return response_text
+
+    def study(self, prompt: str, context: Optional[str] = None) -> AgentResponse:
+        """
+        Modo STUDY: Análise profunda
+        """
+        response_text = self.render_study(prompt, context)
+        
+        agent_response = AgentResponse(
+            mode=AgentMode.STUDY,
+            prompt=prompt,
+            response=response_text,
+            metadata={"depth": "detailed", "context_provided": context is not None}
+        )
+        
+        self.add_to_history(AgentMode.STUDY, prompt, response_text)
+        return agent_response
+
+    def plan(self, prompt: str, goals: Optional[list] = None) -> AgentResponse:
+        """
+        Modo PLAN: Criação de plano
+        """
+        response_text = self.render_plan(prompt, goals)
         
         agent_response = AgentResponse(
             mode=AgentMode.PLAN,
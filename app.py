@@ -1,11 +1,32 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, WebSocket, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
-import uvicorn
-
-from config import API_PORT, API_HOST
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, List, Union, Literal
+import importlib.util
+import json
+import threading
+import time
+import uuid
+
+from config import (
+    API_KEY, API_PORT, API_HOST, WARM_BACKENDS, MODE_BACKENDS,
+    JOB_WORKERS, JOB_MAX_PENDING, JOB_TTL_SECONDS, JOB_MAX_WAIT_SECONDS,
+    WS_IDLE_TIMEOUT_SECONDS, WS_MAX_IN_FLIGHT, WS_SEND_QUEUE_SIZE,
+    COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY,
+    SHUTDOWN_DRAIN_SECONDS, SHUTDOWN_SAVE_SECONDS, STATE_DIR, STATE_MAX_AGENTS
+)
 from agent import SimpleAgent, AgentMode
+from jobs import JobManager, JobQueueFull
+from modes import registry as mode_registry, ModeSpec
+from sessions import AgentSession
+from history_io import iter_history_chunks, iter_arrow_stream, import_chunks
+from compression import CompressionMiddleware
+from text_store import text_store
+from lifecycle import Drainer, DrainMiddleware, draining_server
+from state import save_state, load_state
 
 
 # ==================== MODELOS PYDANTIC ====================
@@ -19,16 +40,154 @@ class StudyRequest(BaseModel):
     prompt: str
     context: Optional[str] = None
     use_gpt: bool = False
+    speculative: bool = False
 
 
 class PlanRequest(BaseModel):
     prompt: str
     goals: Optional[List[str]] = None
     use_gpt: bool = False
+    speculative: bool = False
+
+
+class JobRequest(BaseModel):
+    mode: str = AgentMode.ASK.value
+    prompt: str
+    context: Optional[str] = None
+    goals: Optional[List[str]] = None
+    use_gpt: bool = False
+
+
+class RunRequest(BaseModel):
+    prompt: str
+    context: Optional[str] = None
+    goals: Optional[List[str]] = None
+    use_gpt: bool = False
+
+
+class SessionMessage(BaseModel):
+    """
+    Mensagem de uma sessão WebSocket (veja sessions.py)
+    O agente (e use_gpt) é definido na conexão; campos desconhecidos são
+    recusados em vez de ignorados.
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    id: Optional[Union[str, int]] = None
+    mode: str = "ask"
+    type: Optional[Literal["ping"]] = None
+    prompt: str
+    context: Optional[str] = None
+    goals: Optional[List[str]] = None
+
+
+class ModeRequest(BaseModel):
+    name: str
+    template: Optional[str] = None
+    system_prompt: str = ""
+    base_mode: AgentMode = AgentMode.ASK
+    backend: Optional[str] = None
+    model: Optional[str] = None
+    temperature: Optional[float] = Field(default=None, ge=0, le=2)
+    max_tokens: Optional[int] = Field(default=None, ge=1)
+    required: List[str] = ["prompt"]
+
+
+class AgentSettingsRequest(BaseModel):
+    model: Optional[str] = None
+    backend: Optional[str] = None
+    temperature: Optional[float] = Field(default=None, ge=0, le=2)
+    max_tokens: Optional[int] = Field(default=None, ge=1)
+    max_history: Optional[int] = Field(default=None, ge=1)
 
 
 class AgentInfoRequest(BaseModel):
     agent_name: str = "Agent1"
+    use_gpt: bool = False
+    settings: Optional[AgentSettingsRequest] = None
+
+
+# ==================== BACKENDS (CARREGAMENTO SOB DEMANDA) ====================
+
+# llm_agent e os backends (pacote openai, modelo local) só são carregados no
+# primeiro uso de GPT ou pelo aquecimento em segundo plano na inicialização.
+_gpt_agent_class = None
+_backend_lock = threading.Lock()
+backends_ready = threading.Event()
+# Erro do último aquecimento; /ready fica em 503 com o erro no detalhe
+backend_error = None
+
+
+def get_gpt_agent_class():
+    """Importa GPTAgent na primeira chamada"""
+    global _gpt_agent_class
+    if _gpt_agent_class is None:
+        with _backend_lock:
+            if _gpt_agent_class is None:
+                from llm_agent import GPTAgent
+                _gpt_agent_class = GPTAgent
+    return _gpt_agent_class
+
+
+def warm_backends():
+    """Carrega os backends de LLM; a aplicação só fica pronta se todos carregarem"""
+    global backend_error
+    try:
+        get_gpt_agent_class()
+        from providers import get_provider
+        for backend in set(MODE_BACKENDS.values()):
+            get_provider(backend)
+    except Exception as e:
+        backend_error = f"{type(e).__name__}: {e}"
+        print(f"⚠️  Falha ao carregar backend GPT: {e}")
+        return
+    backend_error = None
+    backends_ready.set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Inicialização e encerramento da aplicação
+    No encerramento: recusa trabalho novo, espera requisições e jobs em
+    andamento e grava o estado em STATE_DIR, recarregado na próxima
+    inicialização. Tudo dentro do prazo do drainer (SHUTDOWN_DRAIN_SECONDS),
+    que sob draining_server começa a contar no sinal, antes da espera de
+    conexões do uvicorn.
+    """
+    global backend_error
+    backend_error = None
+    backends_ready.clear()
+    drainer.reset()
+    job_manager.start()
+    if STATE_DIR:
+        restored = load_state(STATE_DIR, new_agent)
+        with agents_lock:
+            for name, agent in restored.items():
+                agents.setdefault(name, agent)
+            agents_changed()
+        print(f"♻️  {len(restored)} agentes recarregados de {STATE_DIR}")
+    gpt_configured = API_KEY or any(backend != "openai" for backend in MODE_BACKENDS.values())
+    if gpt_configured and WARM_BACKENDS:
+        threading.Thread(target=warm_backends, name="warm-backends", daemon=True).start()
+    else:
+        # Sem GPT configurado (ou sem aquecimento) não há o que esperar
+        backends_ready.set()
+    yield
+
+    # Sem draining_server (ex.: TestClient) o prazo começa aqui
+    drainer.begin()
+    if not await drainer.wait_idle(drainer.wait_budget()):
+        print(f"⚠️  {drainer.in_flight} requisições ainda em andamento no prazo de encerramento")
+    if not await run_in_threadpool(job_manager.drain, drainer.wait_budget()):
+        print("⚠️  Jobs não concluídos no prazo de encerramento foram cancelados")
+    if STATE_DIR:
+        with agents_lock:
+            snapshot = dict(agents)
+        saved = await run_in_threadpool(save_state, STATE_DIR, snapshot, STATE_MAX_AGENTS)
+        print(f"💾 {saved['agents']} agentes e {saved['rows']} entradas de histórico gravados em {STATE_DIR}")
+    # O servidor já não aceita conexões; libera o app para reuso no mesmo processo (ex.: testes)
+    drainer.reset()
 
 
 # ==================== INSTÂNCIA DA APLICAÇÃO ====================
@@ -36,7 +195,8 @@ class AgentInfoRequest(BaseModel):
 app = FastAPI(
     title="Agent API",
     description="API com Agentes que operam em três modos: Ask, Study e Plan",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -48,8 +208,119 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compressão gzip/brotli negociada, acima de COMPRESSION_MIN_SIZE bytes
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MIN_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_quality=COMPRESSION_BROTLI_QUALITY
+)
+
+# Encerramento gracioso: conta requisições em andamento e recusa novas ao drenar
+drainer = Drainer(SHUTDOWN_DRAIN_SECONDS, reserve=SHUTDOWN_SAVE_SECONDS)
+app.add_middleware(DrainMiddleware, drainer=drainer)
+
 # Armazenamento de agentes
+# O lock protege apenas o dicionário (criação/remoção); o histórico de cada
+# agente tem seu próprio lock em BaseAgent.
 agents = {}
+agents_lock = threading.Lock()
+# Muda a cada criação/remoção de agente (ETag de /agent/list)
+agents_version = 0
+
+# Fila de jobs para chamadas longas
+job_manager = JobManager(max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, ttl=JOB_TTL_SECONDS)
+
+
+def new_agent(agent_name: str, use_gpt: bool = False):
+    """Instancia o tipo de agente pedido"""
+    if use_gpt:
+        return get_gpt_agent_class()(name=agent_name)
+    return SimpleAgent(name=agent_name)
+
+
+def get_or_create_agent(agent_name: str, use_gpt: bool = False):
+    """
+    Retorna o agente, criando-o de forma atômica se não existir
+    use_gpt só define o tipo na criação; agentes existentes mantêm o seu.
+    """
+    agent = agents.get(agent_name)
+    if agent is None:
+        with agents_lock:
+            agent = agents.get(agent_name)
+            if agent is None:
+                agent = new_agent(agent_name, use_gpt)
+                agents[agent_name] = agent
+                agents_changed()
+    agent.last_used = time.time()
+    return agent
+
+
+def agents_changed():
+    """Marca a lista de agentes como alterada (chamar com agents_lock)"""
+    global agents_version
+    agents_version += 1
+
+
+def get_agent_or_404(agent_name: str):
+    """Retorna o agente ou levanta 404"""
+    agent = agents.get(agent_name)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Agente não encontrado")
+    agent.last_used = time.time()
+    return agent
+
+
+# ETags incluem um prefixo do processo: versões de antes de um restart nunca batem
+_etag_prefix = uuid.uuid4().hex[:8]
+
+
+def make_etag(version: int) -> str:
+    return f'W/"{_etag_prefix}-{version}"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """
+    Retorna 304 se o If-None-Match do cliente já tem essa versão
+    A versão é lida antes dos dados: se mudar no meio, o cliente recebe
+    dados mais novos com a ETag antiga e apenas baixa de novo na próxima.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def validate_mode(mode: str, request: BaseModel):
+    """Confere se o modo existe e se a requisição tem os campos obrigatórios"""
+    if mode_registry.get(mode) is None:
+        raise HTTPException(status_code=404, detail=f"Modo não encontrado: {mode}")
+    missing = mode_registry.missing_fields(mode, request.model_dump())
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Campos obrigatórios ausentes: {', '.join(missing)}")
+
+
+def run_speculative(agent, agent_name: str, mode: AgentMode, prompt: str,
+                    context: Optional[str] = None, goals: Optional[List[str]] = None) -> dict:
+    """
+    Retorna a estrutura provisória imediatamente e enfileira o refinamento
+    O resultado final é obtido em GET /jobs/{refinement_job_id} e substitui
+    a resposta provisória no histórico; se o job for cancelado ou falhar,
+    a provisória é removida do histórico.
+    """
+    provisional, refine, discard = agent.draft(mode, prompt, context=context, goals=goals)
+    try:
+        job = job_manager.submit(lambda: refine().to_dict(), agent_name=agent_name, mode=mode.value, prompt=prompt,
+                                 on_abort=discard)
+    except JobQueueFull:
+        # Sem capacidade para refinar depois: responde já com a versão final
+        return refine().to_dict()
+    
+    provisional.metadata["refinement_job_id"] = job.id
+    return provisional.to_dict()
 
 
 # ==================== ENDPOINTS ====================
@@ -61,7 +332,7 @@ def root():
         "name": "Agent API",
         "version": "1.0.0",
         "description": "Backend com agentes em três modos: ask, study, plan",
-        "modes": ["ask", "study", "plan"],
+        "modes": mode_registry.names(),
         "docs": "/docs"
     }
 
@@ -69,52 +340,115 @@ def root():
 @app.post("/agent/create")
 def create_agent(request: AgentInfoRequest):
     """Cria um novo agente"""
-    if request.agent_name in agents:
-        raise HTTPException(status_code=400, detail="Agente já existe")
-    
-    # Criar agente simples por padrão
-    agents[request.agent_name] = SimpleAgent(name=request.agent_name)
+    with agents_lock:
+        if request.agent_name in agents:
+            raise HTTPException(status_code=400, detail="Agente já existe")
+        
+        # Criar agente simples por padrão
+        agent = new_agent(request.agent_name, request.use_gpt)
+        if request.settings:
+            agent.update_settings(**request.settings.model_dump(exclude_none=True))
+        agents[request.agent_name] = agent
+        agents_changed()
     
     return {
         "message": "Agente criado com sucesso",
         "agent_name": request.agent_name,
-        "type": "SimpleAgent"
+        "type": type(agent).__name__
     }
 
 
 @app.get("/agent/list")
-def list_agents():
-    """Lista todos os agentes criados"""
+def list_agents(request: Request, response: Response):
+    """Lista todos os agentes criados (com ETag: 304 se nada mudou)"""
+    with agents_lock:
+        etag = make_etag(agents_version)
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
+        names = list(agents.keys())
+    response.headers["ETag"] = etag
     return {
-        "agents": list(agents.keys()),
-        "total": len(agents)
+        "agents": names,
+        "total": len(names)
     }
 
 
 @app.get("/agent/{agent_name}")
-def get_agent_info(agent_name: str):
-    """Retorna informações de um agente"""
-    if agent_name not in agents:
-        raise HTTPException(status_code=404, detail="Agente não encontrado")
-    
-    agent = agents[agent_name]
+def get_agent_info(agent_name: str, request: Request, response: Response):
+    """Retorna informações de um agente (com ETag: 304 se nada mudou)"""
+    agent = get_agent_or_404(agent_name)
+    etag = make_etag(agent.version)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers["ETag"] = etag
     return {
         "name": agent.name,
         "description": agent.description,
+        "type": type(agent).__name__,
+        "settings": agent.settings,
         "history_size": len(agent.get_history())
     }
 
 
+@app.put("/agent/{agent_name}/settings")
+def update_agent_settings(agent_name: str, request: AgentSettingsRequest):
+    """
+    Define ajustes do agente (model, backend, temperature, max_tokens,
+    max_history); campos nulos removem o ajuste
+    """
+    agent = get_agent_or_404(agent_name)
+    agent.update_settings(**request.model_dump())
+    
+    return {
+        "agent_name": agent_name,
+        "settings": agent.settings
+    }
+
+
+@app.get("/modes")
+def list_modes():
+    """Lista os modos disponíveis (nativos e registrados)"""
+    return {
+        "modes": [spec.to_dict() for spec in mode_registry.specs()]
+    }
+
+
+@app.post("/modes")
+def register_mode(request: ModeRequest):
+    """Registra um novo modo, servido por POST /agent/{agent_name}/run/{mode}"""
+    try:
+        spec = ModeSpec(**request.model_dump(mode="json"))
+        mode_registry.register(spec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "message": "Modo registrado com sucesso",
+        "mode": spec.to_dict()
+    }
+
+
+@app.post("/agent/{agent_name}/run/{mode}")
+def agent_run(agent_name: str, mode: str, request: RunRequest):
+    """
+    Executa qualquer modo registrado (incluindo ask, study e plan)
+    """
+    validate_mode(mode, request)
+    agent = get_or_create_agent(agent_name, request.use_gpt)
+    response = mode_registry.run(agent, mode, request.prompt, request.context, request.goals)
+    
+    return response.to_dict()
+
+
 @app.post("/agent/{agent_name}/ask")
 def agent_ask(agent_name: str, request: AskRequest):
     """
     Modo ASK: Pergunta ao agente para uma resposta direta
     """
-    if agent_name not in agents:
-        # Criar agente se não existir
-        agents[agent_name] = SimpleAgent(name=agent_name)
-    
-    agent = agents[agent_name]
+    # Criar agente se não existir
+    agent = get_or_create_agent(agent_name, request.use_gpt)
     response = agent.ask(request.prompt)
     
     return response.to_dict()
@@ -124,11 +458,13 @@ def agent_ask(agent_name: str, request: AskRequest):
 def agent_study(agent_name: str, request: StudyRequest):
     """
     Modo STUDY: Pede ao agente uma análise profunda
+    Com speculative=true (agentes GPT), retorna a estrutura na hora e o
+    refinamento via GET /jobs/{refinement_job_id}
     """
-    if agent_name not in agents:
-        agents[agent_name] = SimpleAgent(name=agent_name)
+    agent = get_or_create_agent(agent_name, request.use_gpt)
+    if request.speculative and hasattr(agent, "draft"):
+        return run_speculative(agent, agent_name, AgentMode.STUDY, request.prompt, context=request.context)
     
-    agent = agents[agent_name]
     response = agent.study(request.prompt, request.context)
     
     return response.to_dict()
@@ -138,23 +474,98 @@ def agent_study(agent_name: str, request: StudyRequest):
 def agent_plan(agent_name: str, request: PlanRequest):
     """
     Modo PLAN: Pede ao agente para criar um plano de ação
+    Com speculative=true (agentes GPT), retorna a estrutura na hora e o
+    refinamento via GET /jobs/{refinement_job_id}
     """
-    if agent_name not in agents:
-        agents[agent_name] = SimpleAgent(name=agent_name)
+    agent = get_or_create_agent(agent_name, request.use_gpt)
+    if request.speculative and hasattr(agent, "draft"):
+        return run_speculative(agent, agent_name, AgentMode.PLAN, request.prompt, goals=request.goals)
     
-    agent = agents[agent_name]
     response = agent.plan(request.prompt, request.goals)
     
     return response.to_dict()
 
 
-@app.get("/agent/{agent_name}/history")
-def get_agent_history(agent_name: str):
-    """Retorna o histórico de conversações do agente"""
-    if agent_name not in agents:
-        raise HTTPException(status_code=404, detail="Agente não encontrado")
+@app.websocket("/agent/{agent_name}/ws")
+async def agent_websocket(websocket: WebSocket, agent_name: str, use_gpt: bool = False):
+    """
+    Sessão WebSocket: o agente é resolvido uma vez e as mensagens
+    {"id", "mode", "prompt", ...} são respondidas em pedaços (veja sessions.py)
+    """
+    await websocket.accept()
+    # Na primeira conexão GPT, importa llm_agent/openai: fora do event loop
+    agent = await run_in_threadpool(get_or_create_agent, agent_name, use_gpt)
+    session = AgentSession(
+        websocket,
+        agent,
+        mode_registry,
+        SessionMessage,
+        idle_timeout=WS_IDLE_TIMEOUT_SECONDS,
+        max_in_flight=WS_MAX_IN_FLIGHT,
+        send_queue_size=WS_SEND_QUEUE_SIZE
+    )
+    await session.serve()
+
+
+@app.post("/agent/{agent_name}/jobs", status_code=202)
+def submit_job(agent_name: str, request: JobRequest):
+    """
+    Enfileira uma chamada ao agente e retorna o id do job imediatamente
+    Consulte o resultado em GET /jobs/{job_id}
+    """
+    validate_mode(request.mode, request)
+    agent = get_or_create_agent(agent_name, request.use_gpt)
+    
+    def run():
+        return mode_registry.run(agent, request.mode, request.prompt, request.context, request.goals).to_dict()
+    
+    try:
+        job = job_manager.submit(run, agent_name=agent_name, mode=request.mode, prompt=request.prompt)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Fila de jobs cheia, tente novamente mais tarde")
     
-    agent = agents[agent_name]
+    return {
+        "job_id": job.id,
+        "status": job.status
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Retorna o estado do job
+    Com wait > 0, aguarda até wait segundos pelo término (long-poll); a
+    espera acontece no event loop, sem ocupar threads do pool
+    """
+    job = await job_manager.wait_async(job_id, timeout=min(max(wait, 0), JOB_MAX_WAIT_SECONDS))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    
+    return job.to_dict()
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancela um job pendente ou em execução"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    
+    return {
+        "job_id": job.id,
+        "status": job.status
+    }
+
+
+@app.get("/agent/{agent_name}/history")
+def get_agent_history(agent_name: str, request: Request, response: Response):
+    """Retorna o histórico de conversações do agente (com ETag: 304 se nada mudou)"""
+    agent = get_agent_or_404(agent_name)
+    etag = make_etag(agent.version)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers["ETag"] = etag
     return {
         "agent_name": agent_name,
         "history": agent.get_history()
@@ -164,10 +575,7 @@ def get_agent_history(agent_name: str):
 @app.delete("/agent/{agent_name}/history")
 def clear_agent_history(agent_name: str):
     """Limpa o histórico do agente"""
-    if agent_name not in agents:
-        raise HTTPException(status_code=404, detail="Agente não encontrado")
-    
-    agent = agents[agent_name]
+    agent = get_agent_or_404(agent_name)
     agent.clear_history()
     
     return {
@@ -176,13 +584,74 @@ def clear_agent_history(agent_name: str):
     }
 
 
+@app.get("/history/export")
+def export_history(since: float = 0, format: str = "jsonl", include_text: bool = True, chunk_size: int = 10000):
+    """
+    Exporta o histórico de todos os agentes em blocos colunares
+    format=jsonl: uma linha JSON por bloco ({"coluna": [...]})
+    format=arrow: Arrow IPC stream (requer pyarrow)
+    O cabeçalho X-History-Watermark é o since da próxima exportação incremental.
+    """
+    if format not in ("jsonl", "arrow"):
+        raise HTTPException(status_code=400, detail="Formato deve ser jsonl ou arrow")
+    if format == "arrow" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=400, detail="Formato arrow requer o pacote pyarrow")
+    
+    watermark = time.time()
+    chunks = iter_history_chunks(agents, since=since, until=watermark, chunk_size=max(1, chunk_size),
+                                 include_text=include_text)
+    if format == "arrow":
+        body, media_type = iter_arrow_stream(chunks, include_text), "application/vnd.apache.arrow.stream"
+    else:
+        body = (json.dumps(chunk, ensure_ascii=False) + "\n" for chunk in chunks)
+        media_type = "application/x-ndjson"
+    
+    return StreamingResponse(body, media_type=media_type, headers={"X-History-Watermark": repr(watermark)})
+
+
+@app.post("/history/import")
+async def import_history(request: Request):
+    """
+    Importa histórico no formato JSONL colunar de /history/export
+    (com include_text), criando os agentes que não existirem
+    """
+    rows = 0
+    # Linha ainda incompleta; a quebra de linha é procurada só nos bytes
+    # recém-chegados, para que uma linha de vários MB não seja varrida a
+    # cada leitura da rede
+    buffer = bytearray()
+    try:
+        async for data in request.stream():
+            start = len(buffer)
+            buffer += data
+            end = buffer.rfind(b"\n", start)
+            if end == -1:
+                continue
+            chunks = [json.loads(line) for line in buffer[:end].split(b"\n") if line.strip()]
+            del buffer[:end + 1]
+            if chunks:
+                rows += await run_in_threadpool(import_chunks, chunks, get_or_create_agent)
+        if buffer.strip():
+            rows += await run_in_threadpool(import_chunks, [json.loads(buffer)], get_or_create_agent)
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Bloco inválido: {e}")
+    
+    return {
+        "message": "Histórico importado com sucesso",
+        "rows": rows
+    }
+
+
 @app.delete("/agent/{agent_name}")
 def delete_agent(agent_name: str):
     """Deleta um agente"""
-    if agent_name not in agents:
-        raise HTTPException(status_code=404, detail="Agente não encontrado")
-    
-    del agents[agent_name]
+    with agents_lock:
+        agent = agents.pop(agent_name, None)
+        if agent is None:
+            raise HTTPException(status_code=404, detail="Agente não encontrado")
+        agents_changed()
+    # Libera os textos do histórico no armazenamento compartilhado
+    agent.clear_history()
     
     return {
         "message": "Agente deletado com sucesso",
@@ -195,7 +664,38 @@ def health_check():
     """Health check endpoint"""
     return {
         "status": "ok",
-        "agents_count": len(agents)
+        "agents_count": len(agents),
+        "jobs": job_manager.stats()
+    }
+
+
+@app.get("/metrics/routing")
+def routing_metrics():
+    """Decisões do roteador de modelos e latência/erros por modelo"""
+    from router import default_router
+    return default_router.metrics()
+
+
+@app.get("/metrics/history")
+def history_metrics():
+    """Memória dos textos do histórico e razão de deduplicação"""
+    return text_store.stats()
+
+
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness: só responde 200 depois que os backends foram carregados
+    Diferente de /health, que indica apenas que o processo está vivo.
+    """
+    if backend_error is not None:
+        raise HTTPException(status_code=503, detail=f"Falha ao carregar backends: {backend_error}")
+    if not backends_ready.is_set():
+        raise HTTPException(status_code=503, detail="Backends ainda carregando")
+    
+    return {
+        "status": "ready",
+        "gpt_loaded": _gpt_agent_class is not None
     }
 
 
@@ -205,9 +705,7 @@ if __name__ == "__main__":
     print(f"🚀 Iniciando Agent API em {API_HOST}:{API_PORT}")
     print(f"📚 Documentação disponível em http://{API_HOST}:{API_PORT}/docs")
     
-    uvicorn.run(
-        app,
-        host=API_HOST,
-        port=API_PORT,
-        log_level="info"
-    )
+    # No SIGTERM, o servidor passa a recusar requisições novas; a espera
+    # das conexões, os jobs e a gravação do estado dividem o mesmo prazo
+    server = draining_server(app, drainer, host=API_HOST, port=API_PORT, log_level="info")
+    server.run()
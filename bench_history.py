@@ -0,0 +1,77 @@
+"""
+Benchmark de memória do histórico
+Compara a memória retida pelo histórico de vários agentes que recebem as
+mesmas perguntas com textos compartilhados (text_store) e com uma cópia
+por entrada (comportamento anterior).
+
+Execute: python bench_history.py
+"""
+
+import gc
+import time
+import tracemalloc
+
+from agent import SimpleAgent
+from text_store import text_store
+
+
+AGENTS = 50
+PROMPTS = [f"Pergunta frequente número {i}: como configurar o ambiente?" for i in range(20)]
+ROUNDS = 5
+
+
+def measure(build):
+    """Bytes retidos pelo objeto construído por build() e o estado do text_store"""
+    gc.collect()
+    tracemalloc.start()
+    retained = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = text_store.stats()
+    del retained
+    return current, stats
+
+
+def build_shared():
+    agents = [SimpleAgent(name=f"agente_{i}") for i in range(AGENTS)]
+    for _ in range(ROUNDS):
+        for agent in agents:
+            for prompt in PROMPTS:
+                agent.study(prompt)
+    return agents
+
+
+def build_copies():
+    """Mesmo histórico com um texto próprio por entrada"""
+    histories = []
+    for _ in range(AGENTS):
+        history = []
+        for _ in range(ROUNDS):
+            for prompt in PROMPTS:
+                history.append({
+                    "mode": "study",
+                    # Cada requisição real traz uma nova str (JSON decodificado)
+                    "prompt": "".join(prompt),
+                    "response": SimpleAgent.render_study(prompt),
+                    "timestamp": time.time()
+                })
+        histories.append(history)
+    return histories
+
+
+def main():
+    print("="*70)
+    print("⏱️  BENCHMARK DE MEMÓRIA DO HISTÓRICO")
+    print("="*70)
+    entries = AGENTS * ROUNDS * len(PROMPTS)
+    copies, _ = measure(build_copies)
+    shared, stats = measure(build_shared)
+    print(f"{entries} entradas ({AGENTS} agentes, {len(PROMPTS)} perguntas, {ROUNDS} rodadas)")
+    print(f"Cópias por entrada:    {copies / 1024:>8.0f} KiB")
+    print(f"Textos compartilhados: {shared / 1024:>8.0f} KiB ({copies / shared:.1f}x menos)")
+    print(f"Razão de deduplicação: {stats['dedup_ratio']} ({stats['unique_texts']} textos únicos)")
+
+
+if __name__ == "__main__":
+    main()
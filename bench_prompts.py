@@ -0,0 +1,63 @@
+"""
+Benchmark de montagem de prompts
+Compara os tokens enviados por chamada entre o formato antigo (system
+prompts com indentação, enviados literalmente) e o PromptAssembler.
+
+Execute: python bench_prompts.py
+"""
+
+import time
+
+from agent import AgentMode
+from llm_agent import GPTAgent
+from prompts import count_tokens, TOKENS_PER_MESSAGE
+
+
+REQUESTS = [
+    (AgentMode.ASK, "Qual é a capital do Brasil?", None, None),
+    (AgentMode.STUDY, "Explique como funciona machine learning", "Para iniciantes em programação", None),
+    (AgentMode.PLAN, "Aprender Python do zero", None, ["Dominar sintaxe básica", "Aprender POO", "Criar projetos reais"])
+]
+
+
+def legacy_tokens(mode, prompt, context, goals) -> int:
+    """Tokens no formato anterior ao PromptAssembler"""
+    user_prompt = prompt
+    if mode == AgentMode.STUDY and context:
+        user_prompt = f"Contexto: {context}\n\nAnálise: {prompt}"
+    if mode == AgentMode.PLAN and goals:
+        goals_text = "\n".join([f"- {goal}" for goal in goals])
+        user_prompt = f"Objetivo: {prompt}\n\nMetas específicas:\n{goals_text}\n\nCrie um plano detalhado."
+    return (count_tokens(GPTAgent.SYSTEM_PROMPTS[mode]) + TOKENS_PER_MESSAGE
+            + count_tokens(user_prompt) + TOKENS_PER_MESSAGE)
+
+
+def main():
+    assembler = GPTAgent.prompt_assembler()
+
+    print("="*70)
+    print("⏱️  BENCHMARK DE PROMPTS")
+    print("="*70)
+    total_before = total_after = 0
+    for mode, prompt, context, goals in REQUESTS:
+        before = legacy_tokens(mode, prompt, context, goals)
+        assembled = assembler.build(mode, prompt, context, goals)
+        total_before += before
+        total_after += assembled.prompt_tokens
+        print(f"{mode.value:<6} antes {before:>4} tokens, depois {assembled.prompt_tokens:>4} tokens "
+              f"({assembled.prefix_tokens} em prefixo fixo)")
+
+    print(f"Total: {total_before} → {total_after} tokens "
+          f"({(1 - total_after / total_before) * 100:.1f}% a menos por rodada)")
+
+    iterations = 10000
+    start = time.perf_counter()
+    for i in range(iterations):
+        mode, prompt, context, goals = REQUESTS[i % len(REQUESTS)]
+        assembler.build(mode, prompt, context, goals)
+    elapsed = time.perf_counter() - start
+    print(f"Montagem: {elapsed / iterations * 1e6:.1f} µs por requisição")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark dos backends de LLM
+Mede a latência de cada modo com o roteamento atual (candidatos por modo
+em config.py), com chamadas concorrentes.
+
+Execute: python bench_providers.py [--calls 20] [--concurrency 4]
+Sem a API real: python bench_providers.py --stub normal:300:80 (todos os
+backends passam a apontar para um stub_llm.py local e determinístico)
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agent import AgentMode
+from llm_agent import GPTAgent
+from providers import HTTPChatProvider, register_provider
+from router import default_router
+
+
+PROMPTS = {
+    AgentMode.ASK: "Qual é a capital do Brasil?",
+    AgentMode.STUDY: "Explique como funciona machine learning",
+    AgentMode.PLAN: "Aprender Python do zero"
+}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench_mode(agent: GPTAgent, mode: AgentMode, calls: int, concurrency: int) -> dict:
+    def timed_call(_):
+        start = time.perf_counter()
+        response = agent.run(mode, PROMPTS[mode])
+        return time.perf_counter() - start, response.response.startswith("Erro ao chamar GPT"), response.metadata["model"]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_call, range(calls)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency, _, _ in results]
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 95),
+        "errors": sum(1 for _, failed, _ in results if failed),
+        "models": sorted({model for _, _, model in results}),
+        "throughput": calls / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos backends de LLM por modo")
+    parser.add_argument("--calls", type=int, default=20, help="Chamadas por modo")
+    parser.add_argument("--concurrency", type=int, default=4, help="Chamadas simultâneas")
+    parser.add_argument("--stub", metavar="LATENCIA", help="Usa o stub_llm.py local com essa distribuição de latência")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="Taxa de tokens do stub")
+    args = parser.parse_args()
+
+    server = None
+    if args.stub:
+        from stub_llm import StubLLM, StubServer
+        server = StubServer(StubLLM(latency=args.stub, tokens_per_second=args.tokens_per_second)).start()
+        for backend in {backend for candidates in default_router.candidates.values() for backend, _ in candidates}:
+            register_provider(backend, HTTPChatProvider(base_url=server.base_url))
+
+    agent = GPTAgent(name="bench")
+
+    print("="*70)
+    print("⏱️  BENCHMARK DE BACKENDS" + (f" (stub {args.stub})" if args.stub else ""))
+    print("="*70)
+    for mode in AgentMode:
+        stats = bench_mode(agent, mode, args.calls, args.concurrency)
+        agent.clear_history()
+        print(f"{mode.value:<6} {','.join(stats['models'])}: p50 {stats['p50_ms']:.1f} ms, "
+              f"p95 {stats['p95_ms']:.1f} ms, {stats['throughput']:.1f} req/s, {stats['errors']} erros")
+    if server is not None:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
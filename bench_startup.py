@@ -0,0 +1,66 @@
+"""
+Benchmark de inicialização
+Mede o tempo de import de app.py e o tempo até a primeira resposta,
+cada rodada em um processo Python novo (sem cache de módulos).
+
+Execute: python bench_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Executado em um processo novo a cada rodada
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app.app) as client:
+    client.post("/agent/bench/ask", json={"prompt": "ping"})
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_s": t1 - t0,
+    "first_request_s": t2 - t0,
+    "openai_loaded_on_import": "openai" in sys.modules
+}))
+"""
+
+
+def run_probe() -> dict:
+    env = dict(os.environ, WARM_BACKENDS="0")
+    output = subprocess.check_output(
+        [sys.executable, "-c", PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização da Agent API")
+    parser.add_argument("--runs", type=int, default=5, help="Número de processos medidos")
+    args = parser.parse_args()
+
+    results = [run_probe() for _ in range(args.runs)]
+    import_times = [r["import_s"] * 1000 for r in results]
+    first_request_times = [r["first_request_s"] * 1000 for r in results]
+
+    print("="*70)
+    print("⏱️  BENCHMARK DE INICIALIZAÇÃO")
+    print("="*70)
+    print(f"Rodadas: {args.runs}")
+    print(f"Import de app.py:        mediana {statistics.median(import_times):.1f} ms "
+          f"(min {min(import_times):.1f}, max {max(import_times):.1f})")
+    print(f"Até a 1ª resposta (ASK): mediana {statistics.median(first_request_times):.1f} ms "
+          f"(min {min(first_request_times):.1f}, max {max(first_request_times):.1f})")
+    print(f"openai carregado no import: {any(r['openai_loaded_on_import'] for r in results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Execução em lote de prompts (offline)
+Processa arquivos JSONL/CSV grandes através dos agentes e grava os
+resultados incrementalmente em JSONL, com checkpoint e retomada.
+
+Execute: python bulk.py entrada.jsonl saida.jsonl [--gpt] [--workers 8]
+
+Formato de entrada (uma linha/registro por prompt):
+    {"id": "1", "mode": "plan", "prompt": "...", "goals": ["a", "b"]}
+No CSV, as colunas são as mesmas e "goals" é separado por ";".
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+from typing import Optional, Dict, Any, Iterator, List
+
+from agent import SimpleAgent, AgentMode
+from modes import registry
+
+
+# Agente reutilizado por processo/worker (evita recriar a cada lote)
+_worker_agent = None
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Lê registros do arquivo de entrada sob demanda (JSONL ou CSV)"""
+    is_csv = path.lower().endswith(".csv")
+    with open(path, encoding="utf-8", newline="" if is_csv else None) as f:
+        rows = csv.DictReader(f) if is_csv else (json.loads(line) for line in f if line.strip())
+        for line_number, record in enumerate(rows, 1):
+            record.setdefault("id", str(line_number))
+            record["id"] = str(record["id"])
+            goals = record.get("goals")
+            if isinstance(goals, str):
+                record["goals"] = [goal for goal in goals.split(";") if goal] or None
+            yield record
+
+
+def run_prompt(agent, record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Executa um registro no agente e retorna a linha de saída
+    Falhas (exceções ou chamadas ao LLM que falharam, com "error" nos
+    metadados da resposta) viram linhas com "error".
+    """
+    try:
+        response = registry.run(
+            agent,
+            record.get("mode") or AgentMode.ASK.value,
+            record["prompt"],
+            context=record.get("context") or None,
+            goals=record.get("goals")
+        )
+        if "error" in response.metadata:
+            raise RuntimeError(response.metadata["error"])
+        result = response.to_dict()
+    except Exception as e:
+        result = {"mode": record.get("mode"), "prompt": record.get("prompt"), "error": str(e)}
+    result["id"] = record["id"]
+    return result
+
+
+def _create_agent(use_gpt: bool):
+    if use_gpt:
+        from llm_agent import GPTAgent
+        return GPTAgent(name="bulk")
+    return SimpleAgent(name="bulk")
+
+
+def process_batch(batch: List[Dict[str, Any]], use_gpt: bool = False) -> List[Dict[str, Any]]:
+    """Processa um lote no worker atual"""
+    global _worker_agent
+    if _worker_agent is None:
+        _worker_agent = _create_agent(use_gpt)
+    results = [run_prompt(_worker_agent, record) for record in batch]
+    # O histórico não interessa no modo lote e cresceria sem limite
+    _worker_agent.clear_history()
+    return results
+
+
+def load_checkpoint(output_path: str) -> set:
+    """
+    Retorna os ids já concluídos no arquivo de saída
+    Linhas com "error" não contam como concluídas: na retomada o registro é
+    refeito e a nova linha é acrescentada depois da antiga (vale a última
+    linha de cada id). Uma última linha incompleta (queda no meio da
+    escrita) é descartada.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    valid_size = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+                if "error" not in result:
+                    done.add(str(result["id"]))
+            except (ValueError, KeyError, TypeError):
+                break
+            valid_size += len(line)
+
+    if valid_size != os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_size)
+    return done
+
+
+def _batches(records: Iterator[Dict[str, Any]], done: set, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for record in records:
+        if record["id"] in done:
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_bulk(input_path: str, output_path: str, use_gpt: bool = False, workers: int = 4,
+             batch_size: Optional[int] = None, resume: bool = True,
+             progress_interval: float = 5.0, executor=None) -> Dict[str, Any]:
+    """
+    Executa o arquivo de entrada e grava os resultados em output_path
+
+    SimpleAgent roda em um pool de processos (trabalho de CPU com templates);
+    GPTAgent roda em um pool de threads, pois o tempo é gasto esperando a API.
+    Apenas workers * 4 lotes ficam em voo, então a memória não depende do
+    tamanho da entrada.
+
+    Returns:
+        Estatísticas da execução (processados, erros, ignorados, throughput)
+    """
+    if batch_size is None:
+        batch_size = 1 if use_gpt else 256
+
+    done = load_checkpoint(output_path) if resume else set()
+    mode = "a" if resume else "w"
+
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=workers) if use_gpt else ProcessPoolExecutor(max_workers=workers)
+
+    stats = {"processed": 0, "errors": 0, "skipped": len(done)}
+    start = last_report = time.monotonic()
+    max_in_flight = workers * 4
+
+    with executor, open(output_path, mode, encoding="utf-8") as out:
+        pending = set()
+        batches = _batches(read_records(input_path), done, batch_size)
+
+        def drain(return_when):
+            nonlocal pending, last_report
+            finished, pending = wait(pending, return_when=return_when)
+            for future in finished:
+                for result in future.result():
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    stats["processed"] += 1
+                    if "error" in result:
+                        stats["errors"] += 1
+            out.flush()
+
+            now = time.monotonic()
+            if progress_interval and now - last_report >= progress_interval:
+                last_report = now
+                rate = stats["processed"] / (now - start)
+                print(f"📈 {stats['processed']} processados ({rate:.1f}/s), {stats['errors']} erros", file=sys.stderr)
+
+        for batch in batches:
+            pending.add(executor.submit(process_batch, batch, use_gpt))
+            if len(pending) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+        if pending:
+            drain(ALL_COMPLETED)
+
+    elapsed = time.monotonic() - start
+    stats["elapsed"] = round(elapsed, 3)
+    stats["throughput"] = round(stats["processed"] / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Executa prompts em lote através dos agentes")
+    parser.add_argument("input", help="Arquivo de entrada (.jsonl ou .csv)")
+    parser.add_argument("output", help="Arquivo de saída (.jsonl), também usado como checkpoint")
+    parser.add_argument("--gpt", action="store_true", help="Usar GPTAgent em vez de SimpleAgent")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Número de workers")
+    parser.add_argument("--batch-size", type=int, default=None, help="Registros por tarefa enviada ao pool")
+    parser.add_argument("--no-resume", action="store_true", help="Reprocessa tudo, sobrescrevendo a saída")
+    args = parser.parse_args(argv)
+
+    stats = run_bulk(
+        args.input,
+        args.output,
+        use_gpt=args.gpt,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        resume=not args.no_resume
+    )
+    print(f"✅ {stats['processed']} processados, {stats['skipped']} já concluídos, "
+          f"{stats['errors']} erros em {stats['elapsed']}s ({stats['throughput']}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+# Caminho explícito evita a busca do .env subindo pelos diretórios no import
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
 
 API_KEY = os.getenv("OPENAI_API_KEY")
 API_PORT = int(os.getenv("API_PORT", 8000))
@@ -11,3 +12,91 @@ API_HOST = os.getenv("API_HOST", "0.0.0.0")
 MODEL_DEFAULT = "gpt-3.5-turbo"
 TEMPERATURE = 0.7
 MAX_TOKENS = 1024
+
+# Backends de LLM: "openai", "http" (servidor compatível com OpenAI) ou "local" (llama.cpp)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+# Endpoint alternativo para o backend openai (ex.: stub_llm.py em testes de desempenho)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 10))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH")
+
+# Roteamento por modo, ex.: LLM_ASK_BACKEND=local, LLM_STUDY_MODEL=gpt-4
+MODE_BACKENDS = {
+    mode: os.getenv(f"LLM_{mode.upper()}_BACKEND", LLM_BACKEND)
+    for mode in ("ask", "study", "plan")
+}
+MODE_MODELS = {
+    mode: os.getenv(f"LLM_{mode.upper()}_MODEL", MODEL_DEFAULT)
+    for mode in ("ask", "study", "plan")
+}
+
+# Roteador de modelos: candidatos por modo, do mais barato ao mais caro,
+# ex.: LLM_ASK_CANDIDATES=http:qwen2.5-0.5b,openai:gpt-3.5-turbo
+MODE_CANDIDATES = {
+    mode: [
+        candidate.split(":", 1)
+        for candidate in os.getenv(
+            f"LLM_{mode.upper()}_CANDIDATES",
+            f"{MODE_BACKENDS[mode]}:{MODE_MODELS[mode]}"
+        ).split(",")
+    ]
+    for mode in ("ask", "study", "plan")
+}
+# SLO de latência (p95) por modo, em milissegundos
+MODE_LATENCY_SLO_MS = {
+    "ask": int(os.getenv("LLM_ASK_SLO_MS", 3000)),
+    "study": int(os.getenv("LLM_STUDY_SLO_MS", 20000)),
+    "plan": int(os.getenv("LLM_PLAN_SLO_MS", 20000))
+}
+MODE_MAX_TOKENS = {
+    "ask": int(os.getenv("LLM_ASK_MAX_TOKENS", 256)),
+    "study": int(os.getenv("LLM_STUDY_MAX_TOKENS", MAX_TOKENS)),
+    "plan": int(os.getenv("LLM_PLAN_MAX_TOKENS", MAX_TOKENS))
+}
+MODE_TEMPERATURES = {
+    mode: float(os.getenv(f"LLM_{mode.upper()}_TEMPERATURE", TEMPERATURE))
+    for mode in ("ask", "study", "plan")
+}
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", 100))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", 5))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", 0.2))
+# Amostras mais antigas que isso não contam: um modelo excluído volta a ser avaliado
+ROUTER_MAX_AGE_SECONDS = float(os.getenv("ROUTER_MAX_AGE_SECONDS", 300))
+# 1 a cada N requisições vai para o candidato mais barato fora do SLO (0 desativa)
+ROUTER_PROBE_EVERY = int(os.getenv("ROUTER_PROBE_EVERY", 20))
+
+# Aquecer o backend GPT em segundo plano na inicialização (senão, no primeiro uso)
+WARM_BACKENDS = os.getenv("WARM_BACKENDS", "1") == "1"
+
+# Fila de jobs assíncronos
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", 1000))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 600))
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", 30))
+
+# Modos customizados carregados na inicialização (arquivo JSON com uma lista
+# de definições: name, template, system_prompt, base_mode, backend, model...)
+MODES_FILE = os.getenv("MODES_FILE")
+
+# Sessões WebSocket
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", 300))
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", 4))
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 64))
+
+# Compressão das respostas HTTP (brotli se instalado, senão gzip)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 5))
+
+# Encerramento gracioso: prazo total, a partir do SIGTERM, para concluir
+# requisições e jobs em andamento e gravar o estado. Deve ficar abaixo do
+# período de graça do orquestrador (ex.: 30s no Kubernetes).
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", 25))
+# Parte do prazo reservada para gravar o estado (não usada nas esperas)
+SHUTDOWN_SAVE_SECONDS = float(os.getenv("SHUTDOWN_SAVE_SECONDS", 3))
+# Diretório onde agentes recentes, histórico e estatísticas do roteador são
+# gravados no encerramento e recarregados na inicialização (vazio = desativado)
+STATE_DIR = os.getenv("STATE_DIR")
+STATE_MAX_AGENTS = int(os.getenv("STATE_MAX_AGENTS", 100))
@@ -0,0 +1,237 @@
+"""
+Exportação e importação do histórico em formato colunar
+Gera blocos (chunks) com uma lista por coluna, sem montar o histórico
+inteiro em memória, para análise (Parquet/Arrow com pyarrow, ou JSONL
+colunar que vira arrays NumPy com np.asarray(chunk["coluna"])).
+
+Execute: python history_io.py info historico.parquet
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Optional, Dict, Any, Iterator, Callable, List
+
+from prompts import count_tokens
+
+
+COLUMNS = (
+    "agent", "mode", "timestamp",
+    "prompt_length", "response_length", "prompt_tokens", "response_tokens",
+    "provisional", "prompt", "response"
+)
+TEXT_COLUMNS = ("prompt", "response")
+# Colunas necessárias para recriar o histórico e o tipo esperado dos valores
+IMPORT_COLUMNS = {
+    "agent": (str,),
+    "mode": (str,),
+    "timestamp": (int, float),
+    "prompt": (str,),
+    "response": (str,)
+}
+
+
+def _empty_chunk(include_text: bool) -> Dict[str, list]:
+    return {column: [] for column in COLUMNS if include_text or column not in TEXT_COLUMNS}
+
+
+def iter_history_chunks(agents: Dict[str, Any], since: float = 0, until: Optional[float] = None,
+                        chunk_size: int = 10000, include_text: bool = True) -> Iterator[Dict[str, list]]:
+    """
+    Percorre o histórico de todos os agentes em blocos colunares
+
+    Apenas entradas com since < timestamp <= until são incluídas; use o
+    until de uma exportação como since da próxima (marca d'água).
+    """
+    chunk = _empty_chunk(include_text)
+    rows = 0
+    for name in list(agents.keys()):
+        agent = agents.get(name)
+        if agent is None:
+            continue
+        for entry in agent.get_history():
+            timestamp = entry.get("timestamp", 0)
+            if timestamp <= since or (until is not None and timestamp > until):
+                continue
+            prompt, response = entry["prompt"], entry["response"]
+            chunk["agent"].append(name)
+            chunk["mode"].append(entry["mode"])
+            chunk["timestamp"].append(timestamp)
+            chunk["prompt_length"].append(len(prompt))
+            chunk["response_length"].append(len(response))
+            chunk["prompt_tokens"].append(count_tokens(prompt))
+            chunk["response_tokens"].append(count_tokens(response))
+            chunk["provisional"].append(entry.get("provisional", False))
+            if include_text:
+                chunk["prompt"].append(prompt)
+                chunk["response"].append(response)
+            rows += 1
+            if rows == chunk_size:
+                yield chunk
+                chunk, rows = _empty_chunk(include_text), 0
+    if rows:
+        yield chunk
+
+
+def _arrow_schema(include_text: bool):
+    import pyarrow as pa
+    fields = [
+        ("agent", pa.string()),
+        ("mode", pa.string()),
+        ("timestamp", pa.float64()),
+        ("prompt_length", pa.int32()),
+        ("response_length", pa.int32()),
+        ("prompt_tokens", pa.int32()),
+        ("response_tokens", pa.int32()),
+        ("provisional", pa.bool_())
+    ]
+    if include_text:
+        fields += [("prompt", pa.string()), ("response", pa.string())]
+    return pa.schema(fields)
+
+
+def _format_for(path: str) -> str:
+    return "parquet" if path.endswith(".parquet") else "jsonl"
+
+
+def export_history(agents: Dict[str, Any], path: str, since: float = 0, chunk_size: int = 10000,
+                   include_text: bool = True, fmt: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Exporta o histórico para um arquivo (.parquet requer pyarrow; senão JSONL colunar)
+
+    Returns:
+        rows, chunks e watermark (o since da próxima exportação incremental)
+    """
+    fmt = fmt or _format_for(path)
+    watermark = time.time()
+    chunks = iter_history_chunks(agents, since=since, until=watermark, chunk_size=chunk_size,
+                                 include_text=include_text)
+    stats = {"rows": 0, "chunks": 0, "watermark": watermark, "path": path}
+
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = _arrow_schema(include_text)
+        with pq.ParquetWriter(path, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pydict(chunk, schema=schema))
+                stats["rows"] += len(chunk["agent"])
+                stats["chunks"] += 1
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+                stats["rows"] += len(chunk["agent"])
+                stats["chunks"] += 1
+    return stats
+
+
+def iter_arrow_stream(chunks: Iterator[Dict[str, list]], include_text: bool = True) -> Iterator[bytes]:
+    """Serializa os blocos como Arrow IPC stream, bloco a bloco (para respostas HTTP)"""
+    import io
+    import pyarrow as pa
+    schema = _arrow_schema(include_text)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pydict(chunk, schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+def read_chunks(path: str) -> Iterator[Dict[str, list]]:
+    """Lê um arquivo exportado bloco a bloco (no Parquet, um row group por bloco)"""
+    if _format_for(path) == "parquet":
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for index in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(index).to_pydict()
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _check_chunk(chunk: Any) -> int:
+    """
+    Valida um bloco antes de importar qualquer linha dele
+
+    Returns:
+        Número de linhas do bloco
+    Raises:
+        ValueError: bloco que não é objeto, colunas ausentes, que não são
+        listas, de tamanhos diferentes ou com valores do tipo errado
+    """
+    if not isinstance(chunk, dict):
+        raise ValueError("Bloco deve ser um objeto com uma lista por coluna")
+    if any(column not in chunk for column in TEXT_COLUMNS):
+        raise ValueError("Importação requer exportação com include_text")
+    missing = [column for column in IMPORT_COLUMNS if column not in chunk]
+    if missing:
+        raise ValueError(f"Colunas ausentes: {', '.join(missing)}")
+
+    not_lists = [column for column, values in chunk.items() if not isinstance(values, list)]
+    if not_lists:
+        raise ValueError(f"Colunas devem ser listas: {', '.join(not_lists)}")
+    lengths = {len(values) for values in chunk.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Colunas com tamanhos diferentes: {sorted(lengths)}")
+
+    expected = dict(IMPORT_COLUMNS, provisional=(bool,))
+    for column, types in expected.items():
+        for value in chunk.get(column, ()):
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                raise ValueError(f"Valor inválido na coluna {column}: {value!r}")
+    return lengths.pop() if lengths else 0
+
+
+def import_chunks(chunks: Iterator[Dict[str, list]], get_agent: Callable[[str], Any]) -> int:
+    """
+    Recria as entradas do histórico a partir de blocos exportados com texto
+    Linhas de agentes para os quais get_agent retorna None são ignoradas.
+    Cada bloco é validado por inteiro antes de ser importado.
+
+    Raises:
+        ValueError: se um bloco for inválido (veja _check_chunk)
+    """
+    rows = 0
+    for chunk in chunks:
+        size = _check_chunk(chunk)
+        provisional = chunk.get("provisional") or [False] * size
+        for agent_name, mode, timestamp, prompt, response, is_provisional in zip(
+            chunk["agent"], chunk["mode"], chunk["timestamp"], chunk["prompt"], chunk["response"], provisional
+        ):
+            agent = get_agent(agent_name)
+            if agent is None:
+                continue
+            agent.add_to_history(mode, prompt, response, provisional=is_provisional, timestamp=timestamp)
+            rows += 1
+    return rows
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) != 2 or argv[0] != "info":
+        print("Uso: python history_io.py info <arquivo.parquet|arquivo.jsonl>")
+        return 1
+
+    rows = chunks = 0
+    agents, modes = set(), {}
+    for chunk in read_chunks(argv[1]):
+        chunks += 1
+        rows += len(chunk["agent"])
+        agents.update(chunk["agent"])
+        for mode in chunk["mode"]:
+            modes[mode] = modes.get(mode, 0) + 1
+    print(f"📦 {argv[1]} ({os.path.getsize(argv[1])} bytes)")
+    print(f"   {rows} entradas em {chunks} blocos, {len(agents)} agentes")
+    print(f"   Por modo: {modes}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+Fila de jobs assíncronos
+Executa chamadas longas (study/plan) em um pool limitado de workers,
+desacoplando a duração da conexão HTTP do tempo de geração.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+
+
+class JobStatus:
+    """Estados possíveis de um job"""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    FINAL = (DONE, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Levantada quando a fila atingiu o limite de jobs pendentes"""
+
+
+class Job:
+    """Estado de um job submetido"""
+
+    def __init__(self, agent_name: str, mode: str, prompt: str):
+        self.id = uuid.uuid4().hex
+        self.agent_name = agent_name
+        self.mode = mode
+        self.prompt = prompt
+        self.status = JobStatus.PENDING
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self.on_abort = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Bloqueia até o job terminar ou o timeout expirar"""
+        return self._done.wait(timeout)
+
+    async def wait_async(self, timeout: float) -> bool:
+        """Espera no event loop, sem ocupar uma thread, até o job terminar ou o timeout expirar"""
+        loop = asyncio.get_running_loop()
+        done = asyncio.Event()
+        callback = lambda: loop.call_soon_threadsafe(done.set)
+        with self._callbacks_lock:
+            if self._done.is_set():
+                return True
+            self._callbacks.append(callback)
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._callbacks_lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+    def _finish(self):
+        with self._callbacks_lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "agent_name": self.agent_name,
+            "mode": self.mode,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobManager:
+    """
+    Gerencia jobs em um pool de threads limitado
+
+    O pool controla centralmente a concorrência com o backend; resultados
+    ficam disponíveis por ttl segundos após o término.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 1000, ttl: float = 600):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = None
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.start()
+
+    def start(self):
+        """Cria o pool de workers (novamente, se tiver sido encerrado)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+
+    def submit(self, fn: Callable[[], Dict[str, Any]], agent_name: str, mode: str, prompt: str,
+               on_abort: Optional[Callable[[], Any]] = None) -> Job:
+        """
+        Enfileira fn para execução
+        on_abort é chamado (uma vez) se o resultado de fn não for entregue:
+        job cancelado, pendente ou em execução (inclusive no encerramento),
+        ou fn com exceção.
+
+        Raises:
+            JobQueueFull: se já houver max_pending jobs aguardando ou se o
+                pool estiver encerrado
+        """
+        self.purge_expired()
+        job = Job(agent_name, mode, prompt)
+        job.on_abort = on_abort
+        with self._lock:
+            if self._executor is None:
+                raise JobQueueFull("Fila de jobs encerrada")
+            if self._pending >= self.max_pending:
+                raise JobQueueFull("Fila de jobs cheia")
+            self._pending += 1
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[], Dict[str, Any]]):
+        with self._lock:
+            self._pending -= 1
+            cancelled = job.status == JobStatus.CANCELLED
+            if not cancelled:
+                job.status = JobStatus.RUNNING
+        if cancelled:
+            self._abort(job)
+            return
+
+        try:
+            result, error, status = fn(), None, JobStatus.DONE
+        except Exception as e:
+            result, error, status = None, str(e), JobStatus.FAILED
+            self._abort(job)
+
+        with self._lock:
+            # Um job cancelado durante a execução descarta o resultado
+            cancelled = job.status == JobStatus.CANCELLED
+            if not cancelled:
+                job.result, job.error, job.status = result, error, status
+                job.finished_at = time.time()
+        if cancelled:
+            self._abort(job)
+        job._finish()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Retorna o job ou None se não existir ou tiver expirado"""
+        self.purge_expired()
+        return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float = 0) -> Optional[Job]:
+        """Long-poll: aguarda até timeout segundos pelo término do job"""
+        job = self.get(job_id)
+        if job is not None and timeout > 0:
+            job.wait(timeout)
+        return job
+
+    async def wait_async(self, job_id: str, timeout: float = 0) -> Optional[Job]:
+        """Long-poll assíncrono: como wait, mas sem bloquear uma thread do pool"""
+        job = self.get(job_id)
+        if job is not None and timeout > 0:
+            await job.wait_async(timeout)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancela o job
+        Jobs pendentes não chegam a executar; jobs em execução terminam
+        a chamada em andamento, mas o resultado é descartado. Em ambos os
+        casos on_abort é chamado já no cancelamento.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            if job.status in JobStatus.FINAL:
+                return job
+            job.status = JobStatus.CANCELLED
+            job.finished_at = time.time()
+            if job.future is not None and job.future.cancel():
+                self._pending -= 1
+        self._abort(job)
+        job._finish()
+        return job
+
+    def _abort(self, job: Job):
+        """Chama on_abort do job uma única vez (cancelamento e fim da execução podem coincidir)"""
+        with self._lock:
+            on_abort, job.on_abort = job.on_abort, None
+        if on_abort is not None:
+            try:
+                on_abort()
+            except Exception as e:
+                print(f"⚠️  Falha na limpeza do job {job.id}: {e}")
+
+    def purge_expired(self):
+        """Remove jobs finalizados há mais de ttl segundos"""
+        deadline = time.time() - self.ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < deadline
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, int]:
+        """Contagem de jobs por estado"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Encerramento gracioso: recusa novos jobs e espera os pendentes e em
+        execução por até timeout segundos; os que não terminarem a tempo são
+        cancelados. Retorna True se todos terminaram.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            active = [job for job in self._jobs.values() if job.status not in JobStatus.FINAL]
+        deadline = time.monotonic() + timeout
+        for job in active:
+            job.wait(max(0, deadline - time.monotonic()))
+        unfinished = [job for job in active if job.status not in JobStatus.FINAL]
+        for job in unfinished:
+            self.cancel(job.id)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return not unfinished
+
+    def shutdown(self, wait: bool = True):
+        """Encerra o pool de workers; novos jobs são recusados até start()"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            pending = [job for job in self._jobs.values() if job.status == JobStatus.PENDING]
+        if not wait:
+            for job in pending:
+                self.cancel(job.id)
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
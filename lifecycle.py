@@ -0,0 +1,123 @@
+"""
+Encerramento gracioso
+Conta as requisições HTTP em andamento e, quando o encerramento começa,
+recusa novas (503 com Retry-After) enquanto as atuais terminam, para que
+o balanceador as envie a outra instância em vez de cortá-las.
+
+Todo o encerramento (espera de conexões do uvicorn, jobs e gravação do
+estado) usa um único prazo, contado a partir do sinal.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+
+class Drainer:
+    """
+    Estado de drenagem da aplicação (usado apenas no event loop)
+
+    timeout é o prazo total do encerramento, que deve ficar abaixo do
+    período de graça do orquestrador; reserve é a parte dele guardada para
+    a gravação do estado, que as esperas (wait_budget) não consomem.
+    """
+
+    def __init__(self, timeout: float = 25, reserve: float = 0):
+        self.timeout = timeout
+        self.reserve = reserve
+        self.draining = False
+        self.in_flight = 0
+        self.deadline: Optional[float] = None
+
+    def begin(self):
+        """Passa a recusar novas requisições; a primeira chamada fixa o prazo"""
+        if not self.draining:
+            self.draining = True
+            self.deadline = time.monotonic() + self.timeout
+
+    def reset(self):
+        self.draining = False
+        self.deadline = None
+
+    def remaining(self) -> float:
+        """Segundos restantes do prazo total"""
+        if self.deadline is None:
+            return self.timeout
+        return max(0.0, self.deadline - time.monotonic())
+
+    def wait_budget(self) -> float:
+        """Segundos que ainda podem ser gastos esperando, preservando a reserva"""
+        return max(0.0, self.remaining() - self.reserve)
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Espera as requisições em andamento até timeout; True se todas terminaram"""
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return self.in_flight == 0
+
+
+class DrainMiddleware:
+    """
+    Middleware ASGI do Drainer
+
+    Durante a drenagem, requisições HTTP novas recebem 503 e conexões
+    WebSocket novas são fechadas com 1013 (tente novamente mais tarde).
+    """
+
+    def __init__(self, app, drainer: Drainer):
+        self.app = app
+        self.drainer = drainer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket" and self.drainer.draining:
+            await send({"type": "websocket.close", "code": 1013})
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.drainer.draining:
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", b"1"),
+                    (b"connection", b"close")
+                ]
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Servidor em encerramento"}'})
+            return
+
+        self.drainer.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.drainer.in_flight -= 1
+
+
+def draining_server(app, drainer: Drainer, **config):
+    """
+    uvicorn.Server que começa a drenagem assim que o encerramento é pedido
+
+    O uvicorn fecha os sockets e espera as conexões abertas antes de
+    encerrar o lifespan. Aqui o Drainer passa a recusar requisições já no
+    sinal (ou em should_exit, antes da espera) e a espera das conexões usa
+    o prazo do Drainer, sem a reserva da gravação do estado.
+
+    O uvicorn só é importado aqui, para não pesar na importação do app.
+    config são os argumentos de uvicorn.Config.
+    """
+    import uvicorn
+
+    class DrainingServer(uvicorn.Server):
+        def handle_exit(self, sig, frame):
+            drainer.begin()
+            super().handle_exit(sig, frame)
+
+        async def shutdown(self, sockets=None):
+            drainer.begin()
+            self.config.timeout_graceful_shutdown = drainer.wait_budget()
+            await super().shutdown(sockets=sockets)
+
+    return DrainingServer(uvicorn.Config(app, **config))
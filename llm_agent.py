@@ -1,12 +1,18 @@
 """
 Agente integrado com OpenAI GPT
 Para usar, configure sua API key no .env
+
+Cada requisição é roteada para um backend/modelo (providers.py) pelo
+roteador de custo/latência (router.py).
 """
 
-from typing import Optional, Dict, Any
-import openai
-from config import API_KEY, MODEL_DEFAULT, TEMPERATURE, MAX_TOKENS
-from agent import BaseAgent, AgentMode, AgentResponse
+import threading
+import time
+from typing import Optional, Dict, Any, Tuple, Callable
+from agent import BaseAgent, SimpleAgent, AgentMode, AgentResponse
+from providers import get_provider
+from prompts import PromptAssembler
+from router import ModelRouter, default_router
 
 
 class GPTAgent(BaseAgent):
@@ -32,87 +38,228 @@ class GPTAgent(BaseAgent):
         Seja prático e objetivo."""
     }
 
-    def __init__(self, name: str = "GPTAgent", description: str = "Agente inteligente baseado em GPT"):
+    # Montador com os SYSTEM_PROMPTS já compactados e contados (criado no primeiro uso)
+    _assembler = None
+
+    @classmethod
+    def prompt_assembler(cls) -> PromptAssembler:
+        if cls.__dict__.get("_assembler") is None:
+            cls._assembler = PromptAssembler(cls.SYSTEM_PROMPTS)
+        return cls._assembler
+
+    def __init__(self, name: str = "GPTAgent", description: str = "Agente inteligente baseado em GPT",
+                 routes: Optional[Dict[AgentMode, Tuple[str, str]]] = None,
+                 router: Optional[ModelRouter] = None):
         super().__init__(name, description)
-        openai.api_key = API_KEY
-        self.model = MODEL_DEFAULT
+        # routes fixa (backend, modelo) por modo; sem isso, o roteador
+        # padrão escolhe entre os candidatos configurados
+        if routes:
+            router = ModelRouter({mode: [route] for mode, route in routes.items()})
+        self.router = router or default_router
+        self.model = self.router.candidates[AgentMode.ASK][0][1]
 
-    def _call_gpt(self, system_prompt: str, user_prompt: str) -> str:
+    def _call_gpt(self, mode: AgentMode, prompt: str, context: Optional[str] = None,
+                  goals: Optional[list] = None, spec=None,
+                  on_chunk: Optional[Callable[[str], None]] = None) -> Tuple[str, Dict[str, Any]]:
         """
-        Chama a API OpenAI GPT
+        Chama o backend de LLM escolhido pelo roteador
+        Parâmetros do modo registrado (spec) e ajustes do agente têm
+        precedência, nessa ordem, sobre a decisão do roteador.
+        Com on_chunk, a resposta é pedida em streaming e cada pedaço é
+        repassado assim que chega.
+        Retorna o texto e os metadados (roteamento e tokens do prompt)
+        Se o backend falhar, o texto é a mensagem de erro e os metadados
+        trazem "error" (use failed() para distinguir de uma resposta).
         """
+        if spec is not None:
+            assembled = self.prompt_assembler().build_custom(spec, prompt, context, goals)
+            mode = spec.base_mode
+        else:
+            assembled = self.prompt_assembler().build(mode, prompt, context, goals)
+        decision = self.router.route(mode, assembled.user_content)
+        if spec is not None:
+            decision.apply(spec.params())
+        if self.settings:
+            decision.apply(self.settings)
+        start = time.perf_counter()
+        request = {
+            "messages": assembled.messages,
+            "model": decision.model,
+            "temperature": decision.temperature,
+            "max_tokens": decision.max_tokens
+        }
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=TEMPERATURE,
-                max_tokens=MAX_TOKENS
-            )
-            return response.choices[0].message.content
+            provider = get_provider(decision.backend)
+            if on_chunk is None:
+                response_text = provider.complete(**request)
+            else:
+                chunks = []
+                for chunk in provider.stream(**request):
+                    chunks.append(chunk)
+                    on_chunk(chunk)
+                response_text = "".join(chunks)
+            ok = True
         except Exception as e:
-            return f"Erro ao chamar GPT: {str(e)}"
+            response_text, ok = f"Erro ao chamar GPT: {str(e)}", False
+            error = f"{type(e).__name__}: {e}"
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.router.record(decision, latency_ms, ok)
+        metadata = {
+            **decision.to_metadata(),
+            **assembled.to_metadata(),
+            "latency_ms": round(latency_ms, 1)
+        }
+        if not ok:
+            metadata["error"] = error
+        return response_text, metadata
+
+    @staticmethod
+    def failed(response: AgentResponse) -> bool:
+        """True se a resposta é a mensagem de erro de uma chamada que falhou"""
+        return "error" in response.metadata
 
     def ask(self, prompt: str) -> AgentResponse:
         """
         Modo ASK: Resposta direta via GPT
         """
-        system_prompt = self.SYSTEM_PROMPTS[AgentMode.ASK]
-        response_text = self._call_gpt(system_prompt, prompt)
+        response_text, route_metadata = self._call_gpt(AgentMode.ASK, prompt)
         
         agent_response = AgentResponse(
             mode=AgentMode.ASK,
             prompt=prompt,
             response=response_text,
-            metadata={"model": self.model}
+            metadata=route_metadata
         )
         
         self.add_to_history(AgentMode.ASK, prompt, response_text)
         return agent_response
 
-    def study(self, prompt: str, context: Optional[str] = None) -> AgentResponse:
-        """
-        Modo STUDY: Análise profunda via GPT
-        """
-        system_prompt = self.SYSTEM_PROMPTS[AgentMode.STUDY]
-        
-        study_prompt = prompt
-        if context:
-            study_prompt = f"Contexto: {context}\n\nAnálise: {prompt}"
-        
-        response_text = self._call_gpt(system_prompt, study_prompt)
+    def _study_response(self, prompt: str, context: Optional[str] = None) -> AgentResponse:
+        """Gera a análise via GPT sem registrar no histórico"""
+        response_text, route_metadata = self._call_gpt(AgentMode.STUDY, prompt, context=context)
         
-        agent_response = AgentResponse(
+        return AgentResponse(
             mode=AgentMode.STUDY,
             prompt=prompt,
             response=response_text,
-            metadata={"model": self.model, "context_provided": context is not None}
+            metadata={**route_metadata, "context_provided": context is not None}
         )
+
+    def _plan_response(self, prompt: str, goals: Optional[list] = None) -> AgentResponse:
+        """Gera o plano via GPT sem registrar no histórico"""
+        response_text, route_metadata = self._call_gpt(AgentMode.PLAN, prompt, goals=goals)
         
-        self.add_to_history(AgentMode.STUDY, prompt, response_text)
+        return AgentResponse(
+            mode=AgentMode.PLAN,
+            prompt=prompt,
+            response=response_text,
+            metadata={**route_metadata, "goals_count": len(goals) if goals else 0}
+        )
+
+    def study(self, prompt: str, context: Optional[str] = None) -> AgentResponse:
+        """
+        Modo STUDY: Análise profunda via GPT
+        """
+        agent_response = self._study_response(prompt, context)
+        self.add_to_history(AgentMode.STUDY, prompt, agent_response.response)
         return agent_response
 
     def plan(self, prompt: str, goals: Optional[list] = None) -> AgentResponse:
         """
         Modo PLAN: Plano de ação via GPT
         """
-        system_prompt = self.SYSTEM_PROMPTS[AgentMode.PLAN]
-        
-        plan_prompt = prompt
-        if goals:
-            goals_text = "\n".join([f"- {goal}" for goal in goals])
-            plan_prompt = f"Objetivo: {prompt}\n\nMetas específicas:\n{goals_text}\n\nCrie um plano detalhado."
-        
-        response_text = self._call_gpt(system_prompt, plan_prompt)
+        agent_response = self._plan_response(prompt, goals)
+        self.add_to_history(AgentMode.PLAN, prompt, agent_response.response)
+        return agent_response
+
+    def run_custom(self, spec, prompt: str, context: Optional[str] = None,
+                   goals: Optional[list] = None) -> AgentResponse:
+        """
+        Modo registrado (modes.ModeSpec) via GPT
+        """
+        response_text, route_metadata = self._call_gpt(spec.base_mode, prompt, context, goals, spec=spec)
         
         agent_response = AgentResponse(
-            mode=AgentMode.PLAN,
+            mode=spec.name,
             prompt=prompt,
             response=response_text,
-            metadata={"model": self.model, "goals_count": len(goals) if goals else 0}
+            metadata={**route_metadata, "custom_mode": True}
         )
         
-        self.add_to_history(AgentMode.PLAN, prompt, response_text)
+        self.add_to_history(spec.name, prompt, response_text)
         return agent_response
+
+    def stream(self, mode: AgentMode, prompt: str, context: Optional[str] = None,
+               goals: Optional[list] = None, on_chunk: Optional[Callable[[str], None]] = None,
+               spec=None) -> AgentResponse:
+        """
+        Executa o modo repassando a resposta do LLM em pedaços para on_chunk
+        O histórico recebe a resposta completa ao final.
+        """
+        mode = spec.base_mode if spec is not None else AgentMode(mode)
+        response_text, metadata = self._call_gpt(mode, prompt, context, goals, spec=spec, on_chunk=on_chunk)
+        
+        if spec is not None:
+            metadata["custom_mode"] = True
+        elif mode == AgentMode.STUDY:
+            metadata["context_provided"] = context is not None
+        elif mode == AgentMode.PLAN:
+            metadata["goals_count"] = len(goals) if goals else 0
+        
+        mode_name = spec.name if spec is not None else mode
+        self.add_to_history(mode_name, prompt, response_text)
+        return AgentResponse(mode=mode_name, prompt=prompt, response=response_text, metadata=metadata)
+
+    def draft(self, mode: AgentMode, prompt: str, context: Optional[str] = None,
+              goals: Optional[list] = None) -> Tuple[AgentResponse, Callable[[], AgentResponse], Callable[[], bool]]:
+        """
+        Resposta especulativa para STUDY/PLAN
+        Retorna imediatamente a estrutura do SimpleAgent como resposta
+        provisória (já registrada no histórico), uma função que gera a
+        versão do GPT e a coloca no lugar da provisória e outra que remove
+        a provisória do histórico se o refinamento for cancelado ou falhar.
+
+        refine() levanta RuntimeError se o backend falhar (a provisória não
+        é trocada pela mensagem de erro) e não altera o histórico depois
+        que discard() foi chamado.
+        """
+        mode = AgentMode(mode)
+        if mode == AgentMode.STUDY:
+            skeleton = SimpleAgent.render_study(prompt, context)
+            generate = lambda: self._study_response(prompt, context)
+        elif mode == AgentMode.PLAN:
+            skeleton = SimpleAgent.render_plan(prompt, goals)
+            generate = lambda: self._plan_response(prompt, goals)
+        else:
+            raise ValueError("Resposta especulativa disponível apenas para study e plan")
+        
+        # Entrada atual (a provisória ou a que a substituiu) e se foi descartada;
+        # o lock torna a substituição e o descarte mutuamente exclusivos
+        current = {"entry": self.add_to_history(mode, prompt, skeleton, provisional=True), "discarded": False}
+        lock = threading.Lock()
+        
+        def refine() -> AgentResponse:
+            agent_response = generate()
+            if self.failed(agent_response):
+                raise RuntimeError(agent_response.metadata["error"])
+            with lock:
+                replaced = None
+                if not current["discarded"]:
+                    replaced = self.replace_history_entry(current["entry"], agent_response.response)
+                    current["entry"] = replaced or current["entry"]
+            agent_response.metadata["replaced_provisional"] = replaced is not None
+            return agent_response
+        
+        def discard() -> bool:
+            with lock:
+                current["discarded"] = True
+                return self.discard_history_entry(current["entry"])
+        
+        provisional = AgentResponse(
+            mode=mode,
+            prompt=prompt,
+            response=skeleton,
+            metadata={"provisional": True}
+        )
+        return provisional, refine, discard
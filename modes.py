@@ -0,0 +1,184 @@
+"""
+Registro de modos
+Permite adicionar modos (ex.: "summarize", "review") com template,
+system prompt e parâmetros de backend sem alterar código. Todos os modos,
+nativos ou não, são despachados por uma tabela pré-computada.
+"""
+
+import json
+import string
+import threading
+from typing import Optional, Dict, Any, List, Callable
+
+from config import MODES_FILE
+from agent import AgentMode, AgentResponse
+from prompts import compact, count_tokens, TOKENS_PER_MESSAGE
+
+
+# Campos aceitos pelos modos e repassados ao agente
+REQUEST_FIELDS = ("prompt", "context", "goals")
+
+
+class _TemplateValues(dict):
+    """Valores do template; campos ausentes viram texto vazio"""
+
+    def __missing__(self, key):
+        return ""
+
+
+def _check_template(template: str):
+    """
+    Aceita apenas campos simples de REQUEST_FIELDS ({prompt}, {goals}...)
+
+    Raises:
+        ValueError: template malformado, campo posicional, desconhecido,
+        com atributo/índice, conversão ou formatação
+    """
+    try:
+        fields = list(string.Formatter().parse(template))
+    except ValueError as e:
+        raise ValueError(f"Template inválido: {e}")
+    for _, field, format_spec, conversion in fields:
+        if field is None:
+            continue
+        if field not in REQUEST_FIELDS or format_spec or conversion:
+            raise ValueError(
+                f"Campo de template inválido: {{{field}}} "
+                f"(use apenas {', '.join('{' + name + '}' for name in REQUEST_FIELDS)})"
+            )
+
+
+class ModeSpec:
+    """Definição de um modo"""
+
+    def __init__(self, name: str, template: Optional[str] = None, system_prompt: str = "",
+                 base_mode: str = AgentMode.ASK.value, backend: Optional[str] = None,
+                 model: Optional[str] = None, temperature: Optional[float] = None,
+                 max_tokens: Optional[int] = None, required: Optional[List[str]] = None,
+                 builtin: bool = False):
+        self.name = name
+        self.template = template or "{prompt}"
+        self.system_prompt = system_prompt
+        # Modo nativo usado para roteamento e SLO de latência
+        self.base_mode = AgentMode(base_mode)
+        self.backend = backend
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.required = tuple(required or ("prompt",))
+        self.builtin = builtin
+
+        unknown = [field for field in self.required if field not in REQUEST_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos obrigatórios desconhecidos: {', '.join(unknown)}")
+        _check_template(self.template)
+
+        # Pré-computado no registro para não repetir a cada requisição
+        self.system_message = {"role": "system", "content": compact(system_prompt)}
+        self.system_tokens = count_tokens(self.system_message["content"]) + TOKENS_PER_MESSAGE
+
+    def params(self) -> Dict[str, Any]:
+        """Parâmetros de backend definidos pelo modo"""
+        params = {
+            "backend": self.backend,
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+        return {key: value for key, value in params.items() if value is not None}
+
+    def render(self, prompt: str, context: Optional[str] = None, goals: Optional[list] = None) -> str:
+        """Aplica o template aos campos da requisição"""
+        return self.template.format_map(_TemplateValues(
+            prompt=prompt,
+            context=context or "",
+            goals="\n".join(f"- {goal}" for goal in goals) if goals else ""
+        ))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "template": self.template,
+            "system_prompt": self.system_prompt,
+            "base_mode": self.base_mode.value,
+            "required": list(self.required),
+            "builtin": self.builtin,
+            **self.params()
+        }
+
+
+class ModeRegistry:
+    """
+    Modos disponíveis e suas tabelas de despacho/validação
+
+    As tabelas são recalculadas apenas no registro de um modo; por
+    requisição há só consultas em dicionário.
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, ModeSpec] = {}
+        self._handlers: Dict[str, Callable] = {}
+        self._required: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        for mode in AgentMode:
+            self.register(ModeSpec(mode.value, base_mode=mode.value, builtin=True))
+
+    def register(self, spec: ModeSpec, replace: bool = False):
+        """
+        Registra um modo
+
+        Raises:
+            ValueError: se o nome já existe (modos nativos nunca são substituídos)
+        """
+        with self._lock:
+            existing = self._specs.get(spec.name)
+            if existing is not None and (existing.builtin or not replace):
+                raise ValueError(f"Modo já existe: {spec.name}")
+
+            if spec.builtin:
+                mode = AgentMode(spec.name)
+                handler = lambda agent, prompt, context, goals: agent.run(mode, prompt, context, goals)
+            else:
+                handler = lambda agent, prompt, context, goals: agent.run_custom(spec, prompt, context, goals)
+
+            self._specs[spec.name] = spec
+            self._handlers[spec.name] = handler
+            self._required[spec.name] = spec.required
+
+    def get(self, name: str) -> Optional[ModeSpec]:
+        return self._specs.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._specs.keys())
+
+    def specs(self) -> List[ModeSpec]:
+        return list(self._specs.values())
+
+    def missing_fields(self, name: str, payload: Dict[str, Any]) -> List[str]:
+        """Campos obrigatórios do modo ausentes na requisição"""
+        return [field for field in self._required[name] if not payload.get(field)]
+
+    def run(self, agent, name: str, prompt: str, context: Optional[str] = None,
+            goals: Optional[list] = None) -> AgentResponse:
+        """
+        Executa o modo no agente
+
+        Raises:
+            KeyError: se o modo não existe
+        """
+        handler = self._handlers.get(getattr(name, "value", name))
+        if handler is None:
+            raise KeyError(f"Modo desconhecido: {name}")
+        return handler(agent, prompt, context, goals)
+
+    def load_file(self, path: str):
+        """Carrega modos de um arquivo JSON (lista de definições)"""
+        with open(path, encoding="utf-8") as f:
+            for definition in json.load(f):
+                self.register(ModeSpec(**definition), replace=True)
+
+
+# Registro global, com os modos do MODES_FILE (se configurado)
+registry = ModeRegistry()
+if MODES_FILE:
+    registry.load_file(MODES_FILE)
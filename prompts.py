@@ -0,0 +1,116 @@
+"""
+Montagem de prompts para os backends de LLM
+Normaliza os system prompts uma única vez, ordena as mensagens com a
+parte fixa primeiro (maximiza o cache de prefixo dos provedores) e
+conta os tokens enviados em cada requisição.
+"""
+
+from functools import lru_cache
+from typing import Optional, Dict, List
+
+from agent import AgentMode
+
+
+# Custo fixo aproximado de cada mensagem no formato de chat (papel, separadores)
+TOKENS_PER_MESSAGE = 4
+
+
+def compact(text: str) -> str:
+    """Remove indentação e linhas vazias sem alterar o conteúdo"""
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    Conta tokens com tiktoken, se instalado
+    Sem tiktoken, usa a estimativa de ~4 caracteres por token.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text))
+
+
+class AssembledPrompt:
+    """Mensagens prontas para envio e sua contagem de tokens"""
+
+    def __init__(self, messages: List[Dict[str, str]], prompt_tokens: int, prefix_tokens: int):
+        self.messages = messages
+        self.prompt_tokens = prompt_tokens
+        self.prefix_tokens = prefix_tokens
+
+    @property
+    def user_content(self) -> str:
+        return self.messages[-1]["content"]
+
+    def to_metadata(self) -> Dict[str, int]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prefix_tokens": self.prefix_tokens
+        }
+
+
+class PromptAssembler:
+    """
+    Monta as mensagens de cada modo
+
+    Os system prompts são compactados e têm os tokens contados na criação;
+    por requisição só a mensagem do usuário é montada e contada. A parte
+    fixa da mensagem do usuário vem antes do conteúdo variável.
+    """
+
+    def __init__(self, system_prompts: Dict[AgentMode, str], model: str = "gpt-3.5-turbo"):
+        self.model = model
+        self.system_messages = {
+            mode: {"role": "system", "content": compact(text)}
+            for mode, text in system_prompts.items()
+        }
+        self.system_tokens = {
+            mode: count_tokens(message["content"], model) + TOKENS_PER_MESSAGE
+            for mode, message in self.system_messages.items()
+        }
+
+    def user_content(self, mode: AgentMode, prompt: str, context: Optional[str] = None,
+                     goals: Optional[list] = None) -> str:
+        if mode == AgentMode.STUDY and context:
+            return "".join(("Contexto: ", context, "\n\nAnálise: ", prompt))
+        if mode == AgentMode.PLAN and goals:
+            parts = ["Crie um plano detalhado.\n\nObjetivo: ", prompt, "\n\nMetas específicas:"]
+            for goal in goals:
+                parts.append("\n- ")
+                parts.append(goal)
+            return "".join(parts)
+        return prompt
+
+    def build_custom(self, spec, prompt: str, context: Optional[str] = None,
+                     goals: Optional[list] = None) -> AssembledPrompt:
+        """Mensagens de um modo registrado (modes.ModeSpec), já pré-compactado"""
+        content = spec.render(prompt, context, goals)
+        user_tokens = count_tokens(content, self.model) + TOKENS_PER_MESSAGE
+        return AssembledPrompt(
+            messages=[spec.system_message, {"role": "user", "content": content}],
+            prompt_tokens=spec.system_tokens + user_tokens,
+            prefix_tokens=spec.system_tokens
+        )
+
+    def build(self, mode: AgentMode, prompt: str, context: Optional[str] = None,
+              goals: Optional[list] = None) -> AssembledPrompt:
+        content = self.user_content(mode, prompt, context, goals)
+        user_tokens = count_tokens(content, self.model) + TOKENS_PER_MESSAGE
+        return AssembledPrompt(
+            messages=[self.system_messages[mode], {"role": "user", "content": content}],
+            prompt_tokens=self.system_tokens[mode] + user_tokens,
+            prefix_tokens=self.system_tokens[mode]
+        )
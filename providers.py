@@ -0,0 +1,205 @@
+"""
+Backends de LLM (provedores)
+Abstrai a chamada de chat para que cada AgentMode possa usar um backend
+e um modelo diferentes: OpenAI, servidor HTTP compatível com OpenAI
+(ex.: llama.cpp server, vLLM, Ollama) ou modelo local via llama.cpp.
+"""
+
+import json
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, List, Iterator
+
+from config import API_KEY, OPENAI_BASE_URL, LLM_BASE_URL, LLM_POOL_SIZE, LLM_TIMEOUT, LOCAL_MODEL_PATH
+
+
+class LLMProvider(ABC):
+    """Interface comum dos backends de LLM"""
+
+    name = "base"
+
+    @abstractmethod
+    def complete(self, messages: List[Dict[str, str]], model: str, temperature: float, max_tokens: int) -> str:
+        """Retorna o texto da resposta para as mensagens de chat"""
+        pass
+
+    def stream(self, messages: List[Dict[str, str]], model: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        """
+        Gera a resposta em pedaços conforme chegam
+        Backends sem streaming entregam a resposta inteira em um pedaço.
+        """
+        yield self.complete(messages, model, temperature, max_tokens)
+
+
+class OpenAIProvider(LLMProvider):
+    """Backend usando o SDK oficial da OpenAI"""
+
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, timeout: float = LLM_TIMEOUT):
+        # Importado aqui para que o pacote openai só seja carregado quando usado
+        import openai
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, timeout=timeout)
+
+    def complete(self, messages, model, temperature, max_tokens) -> str:
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content
+
+    def stream(self, messages, model, temperature, max_tokens) -> Iterator[str]:
+        chunks = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class HTTPChatProvider(LLMProvider):
+    """
+    Backend para qualquer servidor que implemente /chat/completions
+    Usa uma sessão HTTP com pool de conexões próprio por backend.
+    """
+
+    name = "http"
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None, pool_size: int = LLM_POOL_SIZE,
+                 timeout: float = LLM_TIMEOUT):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        if not base_url:
+            raise ValueError("LLM_BASE_URL não configurada para o backend http")
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def complete(self, messages, model, temperature, max_tokens) -> str:
+        response = self.session.post(
+            f"{self.base_url}/chat/completions",
+            json={
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            },
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def stream(self, messages, model, temperature, max_tokens) -> Iterator[str]:
+        """Lê a resposta em Server-Sent Events (stream=true)"""
+        with self.session.post(
+            f"{self.base_url}/chat/completions",
+            json={
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "stream": True
+            },
+            timeout=self.timeout,
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+
+
+class LocalProvider(LLMProvider):
+    """
+    Backend de inferência local em CPU via llama.cpp (llama-cpp-python)
+    O modelo é carregado uma vez; as chamadas são serializadas porque o
+    contexto do llama.cpp não é thread-safe.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path: str, n_ctx: int = 2048):
+        try:
+            from llama_cpp import Llama
+        except ImportError:
+            raise RuntimeError("Backend local requer o pacote llama-cpp-python")
+        if not model_path:
+            raise ValueError("LOCAL_MODEL_PATH não configurado para o backend local")
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, verbose=False)
+        self._lock = threading.Lock()
+
+    def complete(self, messages, model, temperature, max_tokens) -> str:
+        with self._lock:
+            response = self.llm.create_chat_completion(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        return response["choices"][0]["message"]["content"]
+
+    def stream(self, messages, model, temperature, max_tokens) -> Iterator[str]:
+        with self._lock:
+            for chunk in self.llm.create_chat_completion(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            ):
+                content = chunk["choices"][0]["delta"].get("content")
+                if content:
+                    yield content
+
+
+# ==================== REGISTRO ====================
+
+# Uma instância por backend, compartilhada entre agentes (reaproveita
+# conexões e o modelo local carregado)
+_providers: Dict[str, LLMProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def create_provider(name: str) -> LLMProvider:
+    """Cria o backend a partir da configuração"""
+    if name == "openai":
+        return OpenAIProvider(api_key=API_KEY, base_url=OPENAI_BASE_URL)
+    if name == "http":
+        return HTTPChatProvider(base_url=LLM_BASE_URL, api_key=API_KEY)
+    if name == "local":
+        return LocalProvider(model_path=LOCAL_MODEL_PATH)
+    raise ValueError(f"Backend de LLM desconhecido: {name}")
+
+
+def get_provider(name: str) -> LLMProvider:
+    """Retorna (criando na primeira vez) o backend registrado com esse nome"""
+    provider = _providers.get(name)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(name)
+            if provider is None:
+                provider = create_provider(name)
+                _providers[name] = provider
+    return provider
+
+
+def register_provider(name: str, provider: LLMProvider):
+    """Registra uma instância de backend (ex.: customizada ou para testes)"""
+    with _providers_lock:
+        _providers[name] = provider
@@ -0,0 +1,224 @@
+"""
+Roteador de modelos por modo
+Escolhe backend, modelo, max_tokens e temperatura de cada requisição a
+partir do modo, do tamanho do prompt e da latência/taxa de erro
+observadas (janelas móveis) contra o SLO de latência de cada modo.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List, Tuple
+
+from config import (
+    MODE_CANDIDATES, MODE_LATENCY_SLO_MS, MODE_MAX_TOKENS, MODE_TEMPERATURES,
+    ROUTER_WINDOW, ROUTER_MIN_SAMPLES, ROUTER_MAX_ERROR_RATE,
+    ROUTER_MAX_AGE_SECONDS, ROUTER_PROBE_EVERY
+)
+from agent import AgentMode
+from prompts import count_tokens
+
+
+class RollingStats:
+    """
+    Latência e erros das últimas N chamadas de um modelo
+    Só contam amostras dos últimos max_age segundos, para que uma janela
+    ruim antiga não exclua o modelo para sempre.
+    """
+
+    def __init__(self, window: int = ROUTER_WINDOW, max_age: float = ROUTER_MAX_AGE_SECONDS):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.max_age = max_age
+        self.total_calls = 0
+
+    def record(self, latency_ms: float, ok: bool, timestamp: Optional[float] = None):
+        with self._lock:
+            self._samples.append((timestamp if timestamp is not None else time.time(), latency_ms, ok))
+            self.total_calls += 1
+
+    def samples(self) -> List[Tuple[float, float, bool]]:
+        """Amostras ainda válidas (timestamp, latência, sucesso)"""
+        oldest = time.time() - self.max_age
+        with self._lock:
+            return [sample for sample in self._samples if sample[0] >= oldest]
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = self.samples()
+        if not samples:
+            return {"samples": 0, "p50_ms": None, "p95_ms": None, "error_rate": 0.0}
+        latencies = sorted(latency for _, latency, _ in samples)
+        errors = sum(1 for _, _, ok in samples if not ok)
+        return {
+            "samples": len(samples),
+            "p50_ms": latencies[len(latencies) // 2],
+            "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "error_rate": errors / len(samples)
+        }
+
+
+class RouteDecision:
+    """Resultado do roteamento de uma requisição"""
+
+    def __init__(self, mode: AgentMode, backend: str, model: str, max_tokens: int,
+                 temperature: float, reason: str):
+        self.mode = mode
+        self.backend = backend
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.reason = reason
+
+    def apply(self, overrides: Dict[str, Any]):
+        """Aplica ajustes explícitos (do modo ou do agente) sobre a decisão"""
+        for key in ("backend", "model", "temperature", "max_tokens"):
+            if overrides.get(key) is not None:
+                setattr(self, key, overrides[key])
+        if "backend" in overrides or "model" in overrides:
+            self.reason = "override"
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "backend": self.backend,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "route_reason": self.reason
+        }
+
+
+# Estatísticas por (modo, backend, modelo), compartilhadas entre roteadores.
+# Separadas por modo: cada modo compara o p95 com o próprio SLO, e chamadas
+# longas de STUDY/PLAN não devem tirar o ASK de um modelo rápido.
+_stats: Dict[Tuple[str, str, str], RollingStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_stats(mode: AgentMode, backend: str, model: str) -> RollingStats:
+    key = (getattr(mode, "value", mode), backend, model)
+    stats = _stats.get(key)
+    if stats is None:
+        with _stats_lock:
+            stats = _stats.setdefault(key, RollingStats())
+    return stats
+
+
+def export_stats() -> List[Dict[str, Any]]:
+    """Amostras de todas as janelas, para persistir entre reinícios"""
+    with _stats_lock:
+        items = list(_stats.items())
+    return [
+        {"mode": mode, "backend": backend, "model": model, "samples": stats.samples()}
+        for (mode, backend, model), stats in items
+    ]
+
+
+def import_stats(exported: List[Dict[str, Any]]):
+    """Recarrega amostras exportadas: o roteamento já começa com o histórico de latência"""
+    for item in exported:
+        # Formato antigo, sem modo: não dá para saber a que SLO as amostras pertencem
+        if item.get("mode") not in MODE_LATENCY_SLO_MS:
+            continue
+        stats = get_stats(item["mode"], item["backend"], item["model"])
+        for sample in item["samples"]:
+            # Formato antigo, sem timestamp: amostras sem idade conhecida são descartadas
+            if len(sample) == 3:
+                timestamp, latency_ms, ok = sample
+                stats.record(latency_ms, ok, timestamp=timestamp)
+
+
+class ModelRouter:
+    """
+    Roteador de custo/latência
+
+    Os candidatos de cada modo são ordenados do mais barato ao mais caro.
+    O primeiro candidato que cumpre o SLO do modo (p95 e taxa de erro da
+    janela) é escolhido; candidatos ainda sem amostras suficientes são
+    experimentados; se nenhum cumpre, usa o de menor erro/latência.
+    Candidatos mais baratos fora do SLO recebem 1 a cada probe_every
+    requisições, para que a janela deles reflita uma recuperação.
+    """
+
+    def __init__(self, candidates: Optional[Dict[AgentMode, List[Tuple[str, str]]]] = None):
+        self.candidates = {
+            mode: [tuple(candidate) for candidate in MODE_CANDIDATES[mode.value]]
+            for mode in AgentMode
+        }
+        if candidates:
+            self.candidates.update(candidates)
+        self.probe_every = ROUTER_PROBE_EVERY
+        self._decisions: Dict[str, Dict[str, int]] = {}
+        self._skipped: Dict[AgentMode, int] = {}
+        self._lock = threading.Lock()
+
+    def max_tokens_for(self, mode: AgentMode, prompt: str) -> int:
+        """
+        Orçamento de saída: perguntas diretas curtas não precisam do
+        orçamento máximo, então ASK cresce com o tamanho do prompt.
+        """
+        budget = MODE_MAX_TOKENS[mode.value]
+        if mode == AgentMode.ASK:
+            budget = min(budget, 64 + 2 * count_tokens(prompt))
+        return budget
+
+    def route(self, mode: AgentMode, prompt: str) -> RouteDecision:
+        slo_ms = MODE_LATENCY_SLO_MS[mode.value]
+        choice, reason = None, None
+        ranked = []
+
+        for backend, model in self.candidates[mode]:
+            snapshot = get_stats(mode, backend, model).snapshot()
+            if snapshot["samples"] < ROUTER_MIN_SAMPLES:
+                choice, reason = (backend, model), "exploring"
+                break
+            if snapshot["error_rate"] <= ROUTER_MAX_ERROR_RATE and snapshot["p95_ms"] <= slo_ms:
+                choice, reason = (backend, model), "within_slo"
+                break
+            ranked.append(((snapshot["error_rate"], snapshot["p95_ms"]), (backend, model)))
+
+        if choice is None:
+            choice, reason = min(ranked)[1], "fallback"
+        if ranked and ranked[0][1] != choice and self.probe_every:
+            with self._lock:
+                skipped = self._skipped[mode] = self._skipped.get(mode, 0) + 1
+            if skipped % self.probe_every == 0:
+                # O mais barato entre os que ficaram fora do SLO
+                choice, reason = ranked[0][1], "probing"
+
+        decision = RouteDecision(
+            mode=mode,
+            backend=choice[0],
+            model=choice[1],
+            max_tokens=self.max_tokens_for(mode, prompt),
+            temperature=MODE_TEMPERATURES[mode.value],
+            reason=reason
+        )
+        key = f"{decision.backend}/{decision.model}"
+        with self._lock:
+            per_mode = self._decisions.setdefault(mode.value, {})
+            per_mode[key] = per_mode.get(key, 0) + 1
+        return decision
+
+    def record(self, decision: RouteDecision, latency_ms: float, ok: bool):
+        """Registra o resultado da chamada roteada"""
+        get_stats(decision.mode, decision.backend, decision.model).record(latency_ms, ok)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Decisões por modo e estatísticas por modo e modelo"""
+        with self._lock:
+            decisions = {mode: dict(counts) for mode, counts in self._decisions.items()}
+        models = {}
+        for mode in AgentMode:
+            per_mode = models[mode.value] = {}
+            for backend, model in self.candidates[mode]:
+                stats = get_stats(mode, backend, model)
+                per_mode[f"{backend}/{model}"] = {**stats.snapshot(), "total_calls": stats.total_calls}
+        return {
+            "slo_ms": dict(MODE_LATENCY_SLO_MS),
+            "decisions": decisions,
+            "models": models
+        }
+
+
+# Roteador padrão, construído a partir da configuração
+default_router = ModelRouter()
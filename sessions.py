@@ -0,0 +1,167 @@
+"""
+Sessões WebSocket com agentes
+Uma conexão mantém o agente já resolvido e multiplexa várias requisições
+(ask/study/plan ou modos registrados) identificadas por "id", devolvendo
+a resposta em pedaços conforme o LLM gera.
+
+Mensagens do cliente:
+    {"id": "1", "mode": "ask", "prompt": "..."}
+    {"id": "2", "mode": "plan", "prompt": "...", "goals": ["..."]}
+    {"type": "ping"}
+
+Mensagens do servidor:
+    {"id": "1", "type": "chunk", "data": "..."}
+    {"id": "1", "type": "done", "response": {...}}
+    {"id": "1", "type": "error", "detail": "..."}
+    {"type": "pong"}
+"""
+
+import asyncio
+import json
+from typing import Optional, Dict, Any, Type
+
+from pydantic import BaseModel, ValidationError
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+
+class AgentSession:
+    """
+    Sessão de um cliente com um agente
+
+    Backpressure: no máximo max_in_flight requisições por sessão; acima
+    disso o servidor para de ler o socket. As respostas passam por uma fila
+    limitada, então um cliente lento faz o streaming do LLM esperar em vez
+    de acumular memória.
+
+    Cada mensagem é validada com message_model (campos id, mode, type e
+    os da requisição); mensagens inválidas recebem um frame de erro.
+    """
+
+    def __init__(self, websocket: WebSocket, agent, registry, message_model: Type[BaseModel],
+                 idle_timeout: float = 300, max_in_flight: int = 4, send_queue_size: int = 64,
+                 send_timeout: float = 30):
+        self.websocket = websocket
+        self.agent = agent
+        self.registry = registry
+        self.message_model = message_model
+        self.idle_timeout = idle_timeout
+        self.max_in_flight = max_in_flight
+        self.send_timeout = send_timeout
+        self.closed = False
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=send_queue_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def serve(self):
+        """Atende a sessão até o cliente desconectar ou ficar ocioso"""
+        self._loop = asyncio.get_running_loop()
+        writer = asyncio.create_task(self._writer())
+        slots = asyncio.Semaphore(self.max_in_flight)
+        in_flight = set()
+
+        try:
+            while not self.closed:
+                await slots.acquire()
+                try:
+                    message = await asyncio.wait_for(self.websocket.receive_json(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    slots.release()
+                    if in_flight:
+                        continue
+                    await self.websocket.close(code=1000, reason="Sessão ociosa")
+                    break
+                except (json.JSONDecodeError, KeyError):
+                    slots.release()
+                    await self._send({"type": "error", "detail": "Mensagem inválida: JSON esperado"})
+                    continue
+
+                task = asyncio.create_task(self._handle(message))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                task.add_done_callback(lambda _: slots.release())
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            self.closed = True
+            for task in in_flight:
+                task.cancel()
+            writer.cancel()
+
+    async def _writer(self):
+        try:
+            while True:
+                message = await self._outbox.get()
+                await self.websocket.send_json(message)
+        except Exception:
+            self.closed = True
+
+    async def _send(self, message: Dict[str, Any]):
+        await self._outbox.put(message)
+
+    def _send_from_thread(self, message: Dict[str, Any]):
+        """
+        Envia a partir da thread do agente, esperando se a fila estiver cheia
+        Com a sessão encerrada (ou o cliente parado além de send_timeout),
+        os pedaços são descartados e a geração termina normalmente.
+        """
+        if self.closed:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._send(message), self._loop)
+        try:
+            future.result(timeout=self.send_timeout)
+        except Exception:
+            future.cancel()
+            self.closed = True
+
+    async def _handle(self, message: Any):
+        request_id = message.get("id") if isinstance(message, dict) else None
+        if not isinstance(request_id, (str, int)):
+            request_id = None
+        try:
+            await self._process(message, request_id)
+        except Exception as e:
+            await self._send({"id": request_id, "type": "error", "detail": str(e)})
+
+    async def _process(self, message: Any, request_id):
+        if not isinstance(message, dict):
+            await self._send({"type": "error", "detail": "Mensagem inválida: objeto JSON esperado"})
+            return
+        if message.get("type") == "ping":
+            await self._send({"type": "pong"})
+            return
+
+        try:
+            request = self.message_model.model_validate(message)
+        except ValidationError as e:
+            problems = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            await self._send({"id": request_id, "type": "error", "detail": f"Mensagem inválida: {problems}"})
+            return
+
+        spec = self.registry.get(request.mode)
+        if spec is None:
+            await self._send({"id": request_id, "type": "error", "detail": f"Modo não encontrado: {request.mode}"})
+            return
+        missing = self.registry.missing_fields(request.mode, request.model_dump())
+        if missing:
+            await self._send({
+                "id": request_id,
+                "type": "error",
+                "detail": f"Campos obrigatórios ausentes: {', '.join(missing)}"
+            })
+            return
+
+        def on_chunk(chunk: str):
+            self._send_from_thread({"id": request_id, "type": "chunk", "data": chunk})
+
+        response = await run_in_threadpool(
+            self.agent.stream,
+            request.mode,
+            request.prompt,
+            context=request.context,
+            goals=request.goals,
+            on_chunk=on_chunk,
+            spec=None if spec.builtin else spec
+        )
+        await self._send({"id": request_id, "type": "done", "response": response.to_dict()})
@@ -0,0 +1,103 @@
+"""
+Estado persistido entre reinícios
+No encerramento grava os agentes usados mais recentemente (tipo, ajustes
+e histórico) e as estatísticas do roteador; na inicialização recarrega
+tudo, para que o tráfego logo após um deploy encontre agentes e
+roteamento já aquecidos.
+
+Arquivos em STATE_DIR: agents.json, history.jsonl (JSONL colunar de
+history_io) e router.json (amostras por modo, backend e modelo; arquivos
+antigos, sem modo, são ignorados).
+"""
+
+import json
+import os
+import sys
+from typing import Dict, Any, Callable
+
+from history_io import export_history, read_chunks, import_chunks
+
+
+AGENTS_FILE = "agents.json"
+HISTORY_FILE = "history.jsonl"
+ROUTER_FILE = "router.json"
+
+
+def _write_json(path: str, data):
+    """Grava em arquivo temporário e troca, para nunca deixar um arquivo pela metade"""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def save_state(state_dir: str, agents: Dict[str, Any], max_agents: int = 100) -> Dict[str, int]:
+    """
+    Grava os max_agents agentes usados mais recentemente e o roteador
+
+    Returns:
+        agents e rows (entradas de histórico) gravados
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    recent = sorted(agents.items(), key=lambda item: item[1].last_used, reverse=True)[:max_agents]
+
+    history_path = os.path.join(state_dir, HISTORY_FILE)
+    stats = export_history(dict(recent), history_path + ".tmp", fmt="jsonl")
+    os.replace(history_path + ".tmp", history_path)
+
+    _write_json(os.path.join(state_dir, AGENTS_FILE), [
+        {
+            "name": name,
+            "type": type(agent).__name__,
+            "description": agent.description,
+            "settings": agent.settings,
+            "last_used": agent.last_used
+        }
+        for name, agent in recent
+    ])
+
+    # Só há estatísticas novas se o roteador foi usado neste processo
+    if "router" in sys.modules:
+        from router import export_stats
+        _write_json(os.path.join(state_dir, ROUTER_FILE), export_stats())
+
+    return {"agents": len(recent), "rows": stats["rows"]}
+
+
+def load_state(state_dir: str, new_agent: Callable[[str, bool], Any]) -> Dict[str, Any]:
+    """
+    Recria os agentes gravados (com histórico) e recarrega o roteador
+
+    new_agent(nome, use_gpt) cria cada agente; agentes que não puderem ser
+    criados (ex.: backend GPT indisponível) são ignorados com um aviso.
+    Returns:
+        Dicionário nome -> agente
+    """
+    agents_path = os.path.join(state_dir, AGENTS_FILE)
+    if not os.path.exists(agents_path):
+        return {}
+
+    with open(agents_path, encoding="utf-8") as f:
+        saved = json.load(f)
+    agents = {}
+    for meta in saved:
+        try:
+            agent = new_agent(meta["name"], meta["type"] == "GPTAgent")
+        except Exception as e:
+            print(f"⚠️  Agente {meta['name']} não recarregado: {e}")
+            continue
+        agent.description = meta["description"]
+        agent.update_settings(**meta["settings"])
+        agent.last_used = meta["last_used"]
+        agents[meta["name"]] = agent
+
+    history_path = os.path.join(state_dir, HISTORY_FILE)
+    if os.path.exists(history_path):
+        import_chunks(read_chunks(history_path), agents.get)
+
+    router_path = os.path.join(state_dir, ROUTER_FILE)
+    if os.path.exists(router_path):
+        from router import import_stats
+        with open(router_path, encoding="utf-8") as f:
+            import_stats(json.load(f))
+
+    return agents
@@ -0,0 +1,377 @@
+"""
+Servidor LLM simulado (stub) compatível com /v1/chat/completions
+Permite medir latência, streaming, cache e resiliência do GPTAgent sem a
+API real: latência sorteada de uma distribuição, streaming a uma taxa de
+tokens fixa, injeção de erros e gravação/reprodução de trocas reais.
+Com a mesma semente, a sequência de latências, erros e textos se repete.
+
+Execute:
+    python stub_llm.py --port 8001 --latency normal:300:80 --tokens-per-second 40
+    python stub_llm.py --record https://api.openai.com/v1 --cassette gravacoes.jsonl
+    python stub_llm.py --replay gravacoes.jsonl --latency recorded
+
+E aponte o agente para ele:
+    LLM_BACKEND=http LLM_BASE_URL=http://localhost:8001/v1 python app.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+
+WORDS = (
+    "o agente analisa cada etapa do plano com exemplos práticos e conclusões "
+    "claras sobre contexto metas recursos riscos próximos passos resultados "
+    "esperados para o objetivo proposto de forma estruturada e objetiva"
+).split()
+
+
+class LatencyDistribution:
+    """
+    Latência até o primeiro token, em milissegundos
+    fixed:200 | uniform:100:300 | normal:200:50 | lognormal:200:0.5
+    (mediana e sigma) | recorded (a medida na gravação, no modo replay)
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "recorded": 0}
+
+    def __init__(self, spec: str = "fixed:0"):
+        kind, *params = spec.split(":")
+        if self.KINDS.get(kind) != len(params):
+            raise ValueError(f"Distribuição de latência inválida: {spec}")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(param) for param in params]
+
+    def sample(self, rng: random.Random, recorded_ms: float = 0) -> float:
+        """Latência sorteada, em segundos"""
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        else:
+            value = recorded_ms
+        return max(0.0, value) / 1000
+
+
+def request_key(body: Dict[str, Any]) -> str:
+    """Identifica a requisição pelo conteúdo (sem o flag de streaming)"""
+    relevant = {key: body.get(key) for key in ("model", "messages", "temperature", "max_tokens")}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class Cassette:
+    """Trocas gravadas em JSONL: uma linha {"key", "request", "content", "latency_ms"} por troca"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def put(self, key: str, request: Dict[str, Any], content: str, latency_ms: float):
+        entry = {"key": key, "request": request, "content": content, "latency_ms": round(latency_ms, 1)}
+        with self._lock:
+            self._entries[key] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class StubLLM:
+    """
+    Aplicação do servidor simulado
+
+    Modos: synthetic (texto determinístico gerado a partir da requisição),
+    record (repassa ao upstream e grava no cassette) e replay (responde com
+    o cassette; requisições não gravadas recebem 404).
+    """
+
+    def __init__(self, latency: str = "fixed:0", tokens_per_second: float = 0, response_tokens: int = 64,
+                 error_rate: float = 0.0, error_statuses: tuple = (500,), seed: int = 0,
+                 mode: str = "synthetic", cassette: Optional[str] = None,
+                 upstream_url: Optional[str] = None, upstream_key: Optional[str] = None):
+        if mode not in ("synthetic", "record", "replay"):
+            raise ValueError(f"Modo do stub desconhecido: {mode}")
+        if mode != "synthetic" and not cassette:
+            raise ValueError(f"Modo {mode} requer um cassette")
+        if mode == "record" and not upstream_url:
+            raise ValueError("Modo record requer a URL do upstream")
+        self.latency = LatencyDistribution(latency)
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.seed = seed
+        self.mode = mode
+        self.cassette = Cassette(cassette) if cassette else None
+        self.upstream_url = upstream_url.rstrip("/") if upstream_url else None
+        self.upstream_key = upstream_key
+        self._upstream = None
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "streamed": 0, "errors_injected": 0, "recorded": 0,
+                      "replayed": 0, "replay_misses": 0}
+
+        self.app = FastAPI(title="Stub LLM")
+        self.app.post("/v1/chat/completions")(self.chat_completions)
+        self.app.get("/v1/models")(self.list_models)
+        self.app.get("/stub/stats")(self.get_stats)
+
+    def _next_rng(self) -> random.Random:
+        """Gerador da próxima requisição: mesma semente, mesma sequência"""
+        with self._lock:
+            self.stats["requests"] += 1
+            sequence = self.stats["requests"]
+        return random.Random(f"{self.seed}:{sequence}")
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def synthetic_content(self, body: Dict[str, Any], key: str) -> str:
+        """Texto determinístico para a requisição (truncado depois em max_tokens)"""
+        rng = random.Random(key)
+        messages = body.get("messages") or [{}]
+        prompt = str(messages[-1].get("content", ""))[:60]
+        words = [rng.choice(WORDS) for _ in range(self.response_tokens)]
+        return f"Resposta simulada para: {prompt}. " + " ".join(words)
+
+    def _upstream_complete(self, body: Dict[str, Any]) -> str:
+        import requests
+
+        if self._upstream is None:
+            self._upstream = requests.Session()
+            if self.upstream_key:
+                self._upstream.headers["Authorization"] = f"Bearer {self.upstream_key}"
+        response = self._upstream.post(
+            f"{self.upstream_url}/chat/completions",
+            json={**body, "stream": False},
+            timeout=120
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    @staticmethod
+    def _error(status: int, message: str, error_type: str) -> JSONResponse:
+        headers = {"Retry-After": "1"} if status == 429 else None
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": message, "type": error_type, "code": status}},
+            headers=headers
+        )
+
+    @staticmethod
+    def _tokens(content: str) -> List[str]:
+        """Divide o texto em 'tokens' (palavras com o espaço anterior)"""
+        words = content.split(" ")
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    async def chat_completions(self, request: Request):
+        body = await request.json()
+        rng = self._next_rng()
+        if self.error_rate and rng.random() < self.error_rate:
+            self._count("errors_injected")
+            status = rng.choice(self.error_statuses)
+            return self._error(status, "Erro injetado pelo stub", "stub_injected_error")
+
+        key = request_key(body)
+        recorded_ms = 0.0
+        if self.mode == "replay":
+            entry = self.cassette.get(key)
+            if entry is None:
+                self._count("replay_misses")
+                return self._error(404, "Requisição não gravada no cassette", "stub_replay_miss")
+            self._count("replayed")
+            content, recorded_ms = entry["content"], entry["latency_ms"]
+            delay = self.latency.sample(rng, recorded_ms)
+        elif self.mode == "record":
+            start = time.perf_counter()
+            try:
+                content = await run_in_threadpool(self._upstream_complete, body)
+            except Exception as e:
+                return self._error(502, f"Falha no upstream: {e}", "stub_upstream_error")
+            self.cassette.put(key, body, content, (time.perf_counter() - start) * 1000)
+            self._count("recorded")
+            # A latência real já foi paga na chamada ao upstream
+            delay = 0.0
+        else:
+            content = self.synthetic_content(body, key)
+            delay = self.latency.sample(rng)
+
+        max_tokens = body.get("max_tokens")
+        tokens = self._tokens(content)
+        finish_reason = "length" if max_tokens and len(tokens) > max_tokens else "stop"
+        if finish_reason == "length":
+            tokens = tokens[:max_tokens]
+        completion_id = f"chatcmpl-stub-{key[:12]}"
+        model = body.get("model", "stub")
+
+        if body.get("stream"):
+            self._count("streamed")
+            return StreamingResponse(
+                self._stream(tokens, delay, completion_id, model, finish_reason),
+                media_type="text/event-stream"
+            )
+
+        await asyncio.sleep(delay + (len(tokens) / self.tokens_per_second if self.tokens_per_second else 0))
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": finish_reason
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens)
+            }
+        }
+
+    async def _stream(self, tokens: List[str], delay: float, completion_id: str, model: str, finish_reason: str):
+        """Server-Sent Events no formato chat.completion.chunk, a tokens_per_second"""
+        def event(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+        await asyncio.sleep(delay)
+        yield event({"role": "assistant", "content": ""})
+        interval = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        for token in tokens:
+            if interval:
+                await asyncio.sleep(interval)
+            yield event({"content": token})
+        yield event({}, finish_reason)
+        yield "data: [DONE]\n\n"
+
+    async def list_models(self):
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
+
+    async def get_stats(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "mode": self.mode,
+                "latency": self.latency.spec,
+                "cassette_entries": len(self.cassette) if self.cassette else 0
+            }
+
+
+class StubServer:
+    """
+    Executa o stub em uma thread, em uma porta livre (testes e benchmarks)
+
+        with StubServer(StubLLM(latency="fixed:50")) as server:
+            provider = HTTPChatProvider(base_url=server.base_url)
+    """
+
+    def __init__(self, stub: StubLLM, host: str = "127.0.0.1", port: int = 0):
+        import uvicorn
+
+        self.stub = stub
+        self.host = host
+        self.server = uvicorn.Server(uvicorn.Config(stub.app, host=host, port=port, log_level="warning"))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server.servers[0].sockets[0].getsockname()[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self, timeout: float = 10):
+        self._thread = threading.Thread(target=self.server.run, name="stub-llm", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Stub LLM não iniciou")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Servidor LLM simulado compatível com chat completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="fixed:0",
+                        help="fixed:MS | uniform:MIN:MAX | normal:MEDIA:DESVIO | lognormal:MEDIANA:SIGMA | recorded")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Taxa de geração (0 = instantâneo)")
+    parser.add_argument("--response-tokens", type=int, default=64, help="Tamanho das respostas sintéticas")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração de requisições com erro injetado")
+    parser.add_argument("--error-statuses", default="500", help="Status dos erros injetados, ex.: 500,429,503")
+    parser.add_argument("--seed", type=int, default=0, help="Semente (mesma semente, mesma sequência)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--record", metavar="UPSTREAM_URL", help="Grava as trocas com o upstream no cassette")
+    group.add_argument("--replay", metavar="CASSETTE", help="Responde com as trocas gravadas")
+    parser.add_argument("--cassette", help="Arquivo de gravação (modo --record)")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    stub = StubLLM(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        error_statuses=tuple(int(status) for status in args.error_statuses.split(",")),
+        seed=args.seed,
+        mode="record" if args.record else "replay" if args.replay else "synthetic",
+        cassette=args.replay or args.cassette,
+        upstream_url=args.record,
+        upstream_key=os.getenv("OPENAI_API_KEY")
+    )
+    print(f"🧪 Stub LLM ({stub.mode}) em http://{args.host}:{args.port}/v1")
+    uvicorn.run(stub.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,45 @@ Execute: python test_agents.py
 """
 
 import sys
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from agent import SimpleAgent, AgentMode
 
 
+class UvicornThread:
+    """Servidor uvicorn real em uma thread, numa porta livre (testes com concorrência real)"""
+
+    def __init__(self, asgi_app, drainer=None, **config):
+        import uvicorn
+        from lifecycle import draining_server
+        config.update(host="127.0.0.1", port=0, log_level="warning")
+        if drainer is not None:
+            self.server = draining_server(asgi_app, drainer, **config)
+        else:
+            self.server = uvicorn.Server(uvicorn.Config(asgi_app, **config))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.servers[0].sockets[0].getsockname()[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            assert self.thread.is_alive(), "uvicorn não iniciou"
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
 def test_simple_agent():
     """Testa o SimpleAgent em todos os três modos"""
     print("\n" + "="*70)
@@ -134,6 +170,1219 @@ def test_multiple_agents():
     return True
 
 
+def test_concurrent_history():
+    """Testa chamadas concorrentes em agentes compartilhados"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Concorrência no Histórico")
+    print("="*70)
+    
+    print("\n✓ Disparando chamadas concorrentes mistas...")
+    agents = [SimpleAgent(name=f"Agent{i}") for i in range(4)]
+    total_calls = 4000
+    
+    def call(i):
+        agent = agents[i % len(agents)]
+        prompt = f"prompt-{i}"
+        if i % 3 == 0:
+            agent.ask(prompt)
+        elif i % 3 == 1:
+            agent.study(prompt, context="ctx")
+        else:
+            agent.plan(prompt, goals=["a", "b"])
+        # Leituras concorrentes não podem quebrar as escritas
+        agent.get_history()
+    
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(call, range(total_calls)))
+    
+    for idx, agent in enumerate(agents):
+        prompts = [entry["prompt"] for entry in agent.get_history()]
+        expected = {f"prompt-{i}" for i in range(idx, total_calls, len(agents))}
+        assert len(prompts) == len(expected), "entradas perdidas ou duplicadas"
+        assert set(prompts) == expected
+    print(f"  ✅ {total_calls} chamadas sem entradas perdidas ou duplicadas")
+    
+    print("\n✓ Limpando histórico durante escritas...")
+    agent = SimpleAgent(name="ClearAgent")
+    stop = threading.Event()
+    
+    def writer(n):
+        for i in range(500):
+            agent.ask(f"w{n}-{i}")
+    
+    def clearer():
+        while not stop.is_set():
+            agent.clear_history()
+    
+    clear_thread = threading.Thread(target=clearer)
+    clear_thread.start()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(writer, range(8)))
+    stop.set()
+    clear_thread.join()
+    
+    agent.clear_history()
+    for i in range(10):
+        agent.ask(f"final-{i}")
+    history = agent.get_history()
+    assert [entry["prompt"] for entry in history] == [f"final-{i}" for i in range(10)]
+    print(f"  ✅ Histórico consistente após limpezas concorrentes")
+    
+    print("\n✅ Testes de concorrência passaram!")
+    return True
+
+
+def test_concurrent_agent_creation():
+    """Testa a criação concorrente de agentes na API"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Criação Concorrente de Agentes")
+    print("="*70)
+    
+    import app
+    
+    print("\n✓ Criando o mesmo agente a partir de várias threads...")
+    app.agents.clear()
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        created = list(executor.map(lambda _: app.get_or_create_agent("shared"), range(2000)))
+    assert all(agent is created[0] for agent in created)
+    assert len(app.agents) == 1
+    print(f"  ✅ Uma única instância criada para {len(created)} chamadas")
+    
+    app.agents.clear()
+    print("\n✅ Testes de criação concorrente passaram!")
+    return True
+
+
+def test_bulk_runner():
+    """Testa o executor em lote com checkpoint e retomada"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Execução em Lote")
+    print("="*70)
+    
+    import bulk
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "prompts.jsonl")
+        output_path = os.path.join(tmp, "results.jsonl")
+        modes = ["ask", "study", "plan"]
+        with open(input_path, "w", encoding="utf-8") as f:
+            for i in range(1000):
+                f.write(json.dumps({"id": i, "mode": modes[i % 3], "prompt": f"p{i}", "goals": ["a"]}) + "\n")
+        
+        print("\n✓ Processando arquivo com pool de processos...")
+        stats = bulk.run_bulk(input_path, output_path, workers=2, batch_size=100, progress_interval=0)
+        assert stats["processed"] == 1000
+        assert stats["errors"] == 0
+        print(f"  ✅ {stats['processed']} registros processados")
+        
+        print("\n✓ Simulando queda no meio da escrita e retomando...")
+        with open(output_path, "rb") as f:
+            lines = f.readlines()
+        with open(output_path, "wb") as f:
+            f.writelines(lines[:400])
+            f.write(lines[400][:10])
+        stats = bulk.run_bulk(input_path, output_path, workers=2, batch_size=100, progress_interval=0)
+        assert stats["skipped"] == 400
+        assert stats["processed"] == 600
+        
+        with open(output_path, encoding="utf-8") as f:
+            results = [json.loads(line) for line in f]
+        ids = [result["id"] for result in results]
+        assert sorted(ids, key=int) == [str(i) for i in range(1000)]
+        assert all(result["mode"] == modes[int(result["id"]) % 3] for result in results)
+        print(f"  ✅ Retomada sem refazer trabalho concluído")
+        
+        print("\n✓ Registrando falhas do LLM como erros e refazendo-as na retomada...")
+        import providers
+        from concurrent.futures import ThreadPoolExecutor
+        from llm_agent import GPTAgent
+        
+        outage = threading.Event()
+        outage.set()
+        
+        class FlakyProvider(providers.LLMProvider):
+            def complete(self, messages, model, temperature, max_tokens):
+                if outage.is_set():
+                    raise RuntimeError("429 Too Many Requests")
+                return "ok"
+        
+        providers.register_provider("flaky", FlakyProvider())
+        output_path = os.path.join(tmp, "gpt.jsonl")
+        bulk._worker_agent = GPTAgent(name="bulk", routes={mode: ("flaky", "m") for mode in AgentMode})
+        try:
+            stats = bulk.run_bulk(input_path, output_path, use_gpt=True, batch_size=50, progress_interval=0,
+                                  executor=ThreadPoolExecutor(max_workers=4))
+            assert stats["processed"] == 1000 and stats["errors"] == 1000
+            assert bulk.load_checkpoint(output_path) == set()
+            outage.clear()
+            stats = bulk.run_bulk(input_path, output_path, use_gpt=True, batch_size=50, progress_interval=0,
+                                  executor=ThreadPoolExecutor(max_workers=4))
+            assert stats["skipped"] == 0 and stats["processed"] == 1000 and stats["errors"] == 0
+            assert len(bulk.load_checkpoint(output_path)) == 1000
+        finally:
+            bulk._worker_agent = None
+        print(f"  ✅ Falhas gravadas com \"error\" e refeitas na retomada")
+    
+    print("\n✅ Testes de execução em lote passaram!")
+    return True
+
+
+def test_job_manager():
+    """Testa a fila de jobs assíncronos"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Fila de Jobs")
+    print("="*70)
+    
+    from jobs import JobManager, JobQueueFull, JobStatus
+    
+    manager = JobManager(max_workers=1, max_pending=2, ttl=60)
+    agent = SimpleAgent(name="JobAgent")
+    release = threading.Event()
+    
+    print("\n✓ Executando job e aguardando resultado...")
+    job = manager.submit(lambda: agent.run(AgentMode.PLAN, "Plano", goals=["a"]).to_dict(),
+                         agent_name="JobAgent", mode="plan", prompt="Plano")
+    assert manager.wait(job.id, timeout=5).status == JobStatus.DONE
+    assert job.result["metadata"]["goals_count"] == 1
+    print(f"  ✅ Job concluído: {job.id}")
+    
+    print("\n✓ Testando limite da fila e cancelamento...")
+    blocker = manager.submit(lambda: release.wait(5), agent_name="x", mode="ask", prompt="block")
+    while blocker.status != JobStatus.RUNNING:
+        time.sleep(0.001)
+    queued = [manager.submit(lambda: "ok", agent_name="x", mode="ask", prompt=str(i)) for i in range(2)]
+    try:
+        manager.submit(lambda: "ok", agent_name="x", mode="ask", prompt="overflow")
+        assert False, "fila deveria estar cheia"
+    except JobQueueFull:
+        pass
+    assert manager.cancel(queued[0].id).status == JobStatus.CANCELLED
+    assert manager.cancel(blocker.id).status == JobStatus.CANCELLED
+    release.set()
+    assert manager.wait(queued[1].id, timeout=5).status == JobStatus.DONE
+    assert queued[0].result is None and blocker.result is None
+    print(f"  ✅ Fila limitada e cancelamento funcionando")
+    
+    print("\n✓ Testando expiração (TTL)...")
+    manager.ttl = 0
+    time.sleep(0.01)
+    assert manager.get(job.id) is None
+    print(f"  ✅ Resultados expirados removidos")
+    manager.shutdown()
+    
+    print("\n✓ Testando endpoints de jobs...")
+    from fastapi.testclient import TestClient
+    import app
+    client = TestClient(app.app)
+    submitted = client.post("/agent/JobAPI/jobs", json={"mode": "study", "prompt": "Tema", "context": "ctx"})
+    assert submitted.status_code == 202
+    polled = client.get(f"/jobs/{submitted.json()['job_id']}", params={"wait": 5}).json()
+    assert polled["status"] == "done"
+    assert polled["result"]["metadata"]["context_provided"] is True
+    assert client.get("/jobs/inexistente").status_code == 404
+    app.agents.clear()
+    print(f"  ✅ Submissão e long-poll via API")
+    
+    print("\n✓ Long-polls simultâneos sem ocupar o pool de threads...")
+    import requests
+    release = threading.Event()
+    with UvicornThread(app.app) as server:
+        blocked = app.job_manager.submit(lambda: release.wait(5) and {"ok": True}, agent_name="x", mode="ask", prompt="lento")
+        with ThreadPoolExecutor(max_workers=50) as pool:
+            polls = [pool.submit(requests.get, f"{server.url}/jobs/{blocked.id}", params={"wait": 3}) for _ in range(50)]
+            time.sleep(0.5)
+            start = time.perf_counter()
+            assert requests.get(f"{server.url}/health").status_code == 200
+            health_latency = time.perf_counter() - start
+            release.set()
+            assert all(poll.result().json()["status"] == "done" for poll in polls)
+    assert health_latency < 1
+    print(f"  ✅ /health em {health_latency * 1000:.0f} ms com 50 long-polls abertos")
+    
+    print("\n✅ Testes da fila de jobs passaram!")
+    return True
+
+
+def test_lazy_backends():
+    """Testa o carregamento sob demanda do backend GPT e o readiness"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Backends Sob Demanda")
+    print("="*70)
+    
+    print("\n✓ Verificando que importar app não carrega openai nem uvicorn...")
+    code = "import sys, app; print('llm_agent' in sys.modules, 'openai' in sys.modules, 'uvicorn' in sys.modules)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert output.decode().split() == ["False", "False", "False"]
+    print(f"  ✅ openai e uvicorn não são importados na inicialização")
+    
+    print("\n✓ Testando /ready e criação de agente GPT...")
+    from fastapi.testclient import TestClient
+    import app
+    with TestClient(app.app) as client:
+        assert app.backends_ready.wait(10)
+        assert client.get("/ready").status_code == 200
+        created = client.post("/agent/create", json={"agent_name": "gpt", "use_gpt": True}).json()
+        assert created["type"] == "GPTAgent"
+        assert client.get("/agent/gpt").json()["type"] == "GPTAgent"
+    app.agents.clear()
+    print(f"  ✅ Readiness e GPTAgent carregado sob demanda")
+    
+    print("\n✓ Testando /ready após falha no carregamento...")
+    client = TestClient(app.app)
+    original_backends = app.MODE_BACKENDS
+    app.MODE_BACKENDS = {"ask": "inexistente"}
+    app.backends_ready.clear()
+    try:
+        app.warm_backends()
+        not_ready = client.get("/ready")
+        assert not app.backends_ready.is_set()
+        assert not_ready.status_code == 503 and "inexistente" in not_ready.json()["detail"]
+    finally:
+        app.MODE_BACKENDS = original_backends
+        app.backend_error = None
+        app.backends_ready.set()
+    print(f"  ✅ 503 com o erro no detalhe")
+    
+    print("\n✅ Testes de backends sob demanda passaram!")
+    return True
+
+
+def test_llm_providers():
+    """Testa o roteamento de modos para backends de LLM"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Backends de LLM")
+    print("="*70)
+    
+    import providers
+    from llm_agent import GPTAgent
+    
+    class EchoProvider(providers.LLMProvider):
+        name = "echo"
+        
+        def __init__(self):
+            self.calls = []
+        
+        def complete(self, messages, model, temperature, max_tokens):
+            self.calls.append((model, messages))
+            return f"{model}: {messages[-1]['content']}"
+    
+    print("\n✓ Roteando cada modo para backend/modelo próprio...")
+    fast, large = EchoProvider(), EchoProvider()
+    providers.register_provider("fast", fast)
+    providers.register_provider("large", large)
+    agent = GPTAgent(routes={
+        AgentMode.ASK: ("fast", "tiny-local"),
+        AgentMode.STUDY: ("large", "big-model"),
+        AgentMode.PLAN: ("large", "big-model")
+    })
+    ask = agent.ask("oi")
+    study = agent.study("tema", context="ctx")
+    assert ask.response == "tiny-local: oi"
+    assert ask.metadata["model"] == "tiny-local" and ask.metadata["backend"] == "fast"
+    assert study.metadata["backend"] == "large" and study.metadata["context_provided"] is True
+    assert len(fast.calls) == 1 and len(large.calls) == 1
+    print(f"  ✅ ASK → fast/tiny-local, STUDY → large/big-model")
+    
+    print("\n✓ Testando backend HTTP compatível com OpenAI...")
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    
+    class ChatHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": body["model"]}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = HTTPServer(("127.0.0.1", 0), ChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        http_provider = providers.HTTPChatProvider(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+        text = http_provider.complete([{"role": "user", "content": "oi"}], "modelo-local", 0.1, 10)
+        assert text == "modelo-local"
+    finally:
+        server.shutdown()
+    print(f"  ✅ Resposta recebida do servidor local")
+    
+    print("\n✅ Testes de backends passaram!")
+    return True
+
+
+def test_model_router():
+    """Testa o roteador de custo/latência"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Roteador de Modelos")
+    print("="*70)
+    
+    from router import ModelRouter, get_stats
+    from config import MODE_LATENCY_SLO_MS, MODE_MAX_TOKENS, ROUTER_MIN_SAMPLES, ROUTER_MAX_AGE_SECONDS
+    
+    router = ModelRouter({AgentMode.ASK: [("test", "cheap-model"), ("test", "fast-model")]})
+    
+    print("\n✓ Explorando o candidato mais barato primeiro...")
+    decision = router.route(AgentMode.ASK, "oi")
+    assert decision.model == "cheap-model" and decision.reason == "exploring"
+    assert decision.max_tokens == min(MODE_MAX_TOKENS["ask"], 66)
+    print(f"  ✅ {decision.model} com max_tokens={decision.max_tokens}")
+    
+    print("\n✓ Trocando de modelo quando o SLO é violado...")
+    slo = MODE_LATENCY_SLO_MS["ask"]
+    for _ in range(ROUTER_MIN_SAMPLES):
+        router.record(decision, slo * 2, True)
+    decision = router.route(AgentMode.ASK, "oi")
+    assert decision.model == "fast-model"
+    for _ in range(ROUTER_MIN_SAMPLES):
+        router.record(decision, slo / 10, True)
+    decision = router.route(AgentMode.ASK, "oi")
+    assert decision.model == "fast-model" and decision.reason == "within_slo"
+    assert decision.to_metadata()["route_reason"] == "within_slo"
+    print(f"  ✅ Roteado para {decision.model} ({decision.reason})")
+    
+    print("\n✓ Verificando métricas...")
+    metrics = router.metrics()
+    assert metrics["decisions"]["ask"]["test/fast-model"] == 2
+    assert metrics["models"]["ask"]["test/cheap-model"]["p95_ms"] == slo * 2
+    print(f"  ✅ Decisões registradas: {metrics['decisions']['ask']}")
+    
+    print("\n✓ Sondando o candidato barato excluído...")
+    router = ModelRouter({AgentMode.ASK: [("test", "cheap-recovering"), ("test", "fast-steady")]})
+    cheap, fast = ("test", "cheap-recovering"), ("test", "fast-steady")
+    old = time.time() - ROUTER_MAX_AGE_SECONDS - 1
+    for _ in range(ROUTER_MIN_SAMPLES):
+        get_stats(AgentMode.ASK, *cheap).record(slo * 2, True, timestamp=old)
+        get_stats(AgentMode.ASK, *cheap).record(slo * 2, True)
+        get_stats(AgentMode.ASK, *fast).record(slo / 10, True)
+    decisions = [router.route(AgentMode.ASK, "oi") for _ in range(router.probe_every)]
+    probes = [decision for decision in decisions if decision.reason == "probing"]
+    assert len(probes) == 1 and probes[0].model == "cheap-recovering"
+    print(f"  ✅ 1 de {router.probe_every} requisições sonda o modelo excluído")
+    
+    print("\n✓ Voltando ao modelo barato recuperado...")
+    router = ModelRouter({AgentMode.ASK: [("test", "cheap-recovered"), fast]})
+    for _ in range(ROUTER_MIN_SAMPLES):
+        get_stats(AgentMode.ASK, "test", "cheap-recovered").record(slo * 2, True, timestamp=old)
+        get_stats(AgentMode.ASK, "test", "cheap-recovered").record(slo / 10, True)
+    decision = router.route(AgentMode.ASK, "oi")
+    assert decision.model == "cheap-recovered" and decision.reason == "within_slo"
+    print(f"  ✅ Amostras ruins antigas expiram e o modelo barato volta a ser escolhido")
+    
+    print("\n✓ Separando a latência de modos diferentes no mesmo modelo...")
+    shared, premium = ("test", "shared-model"), ("test", "premium-model")
+    router = ModelRouter({mode: [shared, premium] for mode in (AgentMode.ASK, AgentMode.STUDY)})
+    for _ in range(ROUTER_MIN_SAMPLES):
+        router.record(router.route(AgentMode.ASK, "oi"), slo / 2, True)
+        router.record(router.route(AgentMode.STUDY, "tema"), MODE_LATENCY_SLO_MS["study"] * 2, True)
+    assert router.route(AgentMode.ASK, "oi").model == "shared-model"
+    assert router.route(AgentMode.STUDY, "tema").model == "premium-model"
+    metrics = router.metrics()["models"]
+    assert metrics["ask"]["test/shared-model"]["p95_ms"] == slo / 2
+    assert metrics["study"]["test/shared-model"]["p95_ms"] == MODE_LATENCY_SLO_MS["study"] * 2
+    print(f"  ✅ STUDY lento não tira o ASK do modelo compartilhado")
+    
+    print("\n✅ Testes do roteador passaram!")
+    return True
+
+
+def test_speculative_response():
+    """Testa a resposta provisória com refinamento posterior"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Resposta Especulativa")
+    print("="*70)
+    
+    import providers
+    from llm_agent import GPTAgent
+    
+    release = threading.Event()
+    
+    class SlowProvider(providers.LLMProvider):
+        def complete(self, messages, model, temperature, max_tokens):
+            release.wait(5)
+            return "PLANO REFINADO"
+    
+    providers.register_provider("slow", SlowProvider())
+    routes = {mode: ("slow", "slow-model") for mode in AgentMode}
+    
+    print("\n✓ Obtendo estrutura provisória sem esperar o LLM...")
+    agent = GPTAgent(name="Spec", routes=routes)
+    provisional, refine, _ = agent.draft(AgentMode.PLAN, "Aprender Python", goals=["POO"])
+    assert "PASSOS DE EXECUÇÃO" in provisional.response
+    assert provisional.metadata["provisional"] is True
+    assert agent.get_history()[0]["provisional"] is True
+    draft_timestamp = agent.get_history()[0]["timestamp"]
+    print(f"  ✅ Estrutura provisória com {len(provisional.response)} caracteres")
+    
+    print("\n✓ Substituindo a provisória pela versão refinada...")
+    release.set()
+    agent.ask("pergunta seguinte")
+    final = refine()
+    history = agent.get_history()
+    assert final.response == "PLANO REFINADO" and final.metadata["replaced_provisional"] is True
+    assert history[0]["response"] == "PLANO REFINADO" and "provisional" not in history[0]
+    assert history[1]["prompt"] == "pergunta seguinte"
+    assert history[0]["timestamp"] > draft_timestamp
+    print(f"  ✅ Histórico atualizado na mesma posição, com novo timestamp")
+    
+    print("\n✓ Testando via API com refinement_job_id...")
+    from fastapi.testclient import TestClient
+    import app
+    release.clear()
+    app.agents["SpecAPI"] = GPTAgent(name="SpecAPI", routes=routes)
+    with TestClient(app.app) as client:
+        body = client.post("/agent/SpecAPI/study", json={"prompt": "IA", "speculative": True}).json()
+        assert body["metadata"]["provisional"] is True and "CONTEXTO" in body["response"]
+        release.set()
+        job = client.get(f"/jobs/{body['metadata']['refinement_job_id']}", params={"wait": 5}).json()
+        assert job["status"] == "done" and job["result"]["response"] == "PLANO REFINADO"
+        assert client.get("/agent/SpecAPI/history").json()["history"][0]["response"] == "PLANO REFINADO"
+        
+        print("\n✓ Removendo a provisória quando o refinamento é cancelado...")
+        release.clear()
+        app.agents["SpecAPI"].clear_history()
+        blocker = app.job_manager.submit(lambda: release.wait(5) and {}, agent_name="x", mode="ask", prompt="x")
+        blockers = [app.job_manager.submit(lambda: release.wait(5) and {}, agent_name="x", mode="ask", prompt="x")
+                    for _ in range(app.job_manager.max_workers)]
+        body = client.post("/agent/SpecAPI/plan", json={"prompt": "cancelado", "speculative": True}).json()
+        assert client.get("/agent/SpecAPI/history").json()["history"][0]["provisional"] is True
+        assert client.delete(f"/jobs/{body['metadata']['refinement_job_id']}").json()["status"] == "cancelled"
+        assert client.get("/agent/SpecAPI/history").json()["history"] == []
+        release.set()
+        assert all(job.wait(5) for job in [blocker] + blockers)
+        
+        print("\n✓ Removendo a provisória quando o job é cancelado em execução...")
+        release.clear()
+        body = client.post("/agent/SpecAPI/plan", json={"prompt": "em execução", "speculative": True}).json()
+        job_id = body["metadata"]["refinement_job_id"]
+        while app.job_manager.get(job_id).status != "running":
+            time.sleep(0.01)
+        assert client.delete(f"/jobs/{job_id}").json()["status"] == "cancelled"
+        assert client.get("/agent/SpecAPI/history").json()["history"] == []
+        release.set()
+        assert app.job_manager.get(job_id).wait(5)
+        time.sleep(0.05)
+        assert client.get("/agent/SpecAPI/history").json()["history"] == []
+        assert client.get(f"/jobs/{job_id}").json()["status"] == "cancelled"
+        
+        print("\n✓ Removendo a provisória quando o backend falha...")
+        
+        class FailingProvider(providers.LLMProvider):
+            def complete(self, messages, model, temperature, max_tokens):
+                raise ConnectionError("backend fora do ar")
+        
+        providers.register_provider("failing", FailingProvider())
+        app.agents["SpecFail"] = GPTAgent(name="SpecFail", routes={mode: ("failing", "m") for mode in AgentMode})
+        body = client.post("/agent/SpecFail/study", json={"prompt": "IA", "speculative": True}).json()
+        job = client.get(f"/jobs/{body['metadata']['refinement_job_id']}", params={"wait": 5}).json()
+        assert job["status"] == "failed" and "backend fora do ar" in job["error"]
+        assert client.get("/agent/SpecFail/history").json()["history"] == []
+    app.agents.clear()
+    print(f"  ✅ Refinamento entregue pela fila de jobs; cancelado ou com falha, a provisória sai do histórico")
+    
+    print("\n✅ Testes de resposta especulativa passaram!")
+    return True
+
+
+def test_prompt_assembly():
+    """Testa a montagem compacta de prompts e a contagem de tokens"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Montagem de Prompts")
+    print("="*70)
+    
+    from prompts import compact
+    from llm_agent import GPTAgent
+    
+    print("\n✓ Compactando system prompts...")
+    assembler = GPTAgent.prompt_assembler()
+    assert assembler is GPTAgent.prompt_assembler()
+    for mode in AgentMode:
+        content = assembler.system_messages[mode]["content"]
+        assert "  " not in content and content == compact(GPTAgent.SYSTEM_PROMPTS[mode])
+        assert len(content) < len(GPTAgent.SYSTEM_PROMPTS[mode])
+    print(f"  ✅ System prompts sem indentação")
+    
+    print("\n✓ Montando mensagens com a parte fixa primeiro...")
+    first = assembler.build(AgentMode.PLAN, "Objetivo A", goals=["x", "y"])
+    second = assembler.build(AgentMode.PLAN, "Objetivo B", goals=["z"])
+    assert first.messages[0] is second.messages[0]
+    assert first.user_content == "Crie um plano detalhado.\n\nObjetivo: Objetivo A\n\nMetas específicas:\n- x\n- y"
+    assert first.prompt_tokens > first.prefix_tokens > 0
+    print(f"  ✅ {first.prompt_tokens} tokens ({first.prefix_tokens} de prefixo fixo)")
+    
+    print("\n✓ Registrando tokens nos metadados...")
+    import providers
+    
+    class EchoProvider(providers.LLMProvider):
+        def complete(self, messages, model, temperature, max_tokens):
+            return messages[-1]["content"]
+    
+    providers.register_provider("echo", EchoProvider())
+    agent = GPTAgent(routes={mode: ("echo", "echo-model") for mode in AgentMode})
+    response = agent.study("IA", context="iniciantes")
+    assert response.response == "Contexto: iniciantes\n\nAnálise: IA"
+    assert response.metadata["prompt_tokens"] > response.metadata["cached_prefix_tokens"]
+    print(f"  ✅ prompt_tokens={response.metadata['prompt_tokens']}")
+    
+    print("\n✅ Testes de montagem de prompts passaram!")
+    return True
+
+
+def test_mode_registry():
+    """Testa modos registrados e ajustes por agente"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Registro de Modos")
+    print("="*70)
+    
+    import providers
+    from modes import ModeRegistry, ModeSpec
+    from llm_agent import GPTAgent
+    
+    registry = ModeRegistry()
+    registry.register(ModeSpec(
+        "summarize",
+        template="Resuma em tópicos:\n{prompt}",
+        system_prompt="""Você resume textos.
+            Seja breve.""",
+        model="resumidor",
+        temperature=0.1
+    ))
+    
+    print("\n✓ Executando modo registrado no SimpleAgent...")
+    agent = SimpleAgent(name="ModeAgent")
+    response = registry.run(agent, "summarize", "texto longo")
+    assert response.to_dict()["mode"] == "summarize"
+    assert response.response == "Resuma em tópicos:\ntexto longo"
+    assert registry.run(agent, "ask", "oi").mode == AgentMode.ASK
+    assert [entry["mode"] for entry in agent.get_history()] == ["summarize", "ask"]
+    print(f"  ✅ Modos nativos e registrados no mesmo despacho")
+    
+    print("\n✓ Validando registro e campos obrigatórios...")
+    try:
+        registry.register(ModeSpec("ask"))
+        assert False, "modo nativo não pode ser substituído"
+    except ValueError:
+        pass
+    registry.register(ModeSpec("review", template="{context}\n---\n{prompt}", required=["prompt", "context"]))
+    assert registry.missing_fields("review", {"prompt": "código"}) == ["context"]
+    for template in ("{", "}", "{0}", "{}", "{prompt.upper}", "{prompt[0]}", "{prompt!r}", "{prompt:>9}", "{senha}"):
+        try:
+            ModeSpec("ruim", template=template)
+            assert False, f"template aceito: {template}"
+        except ValueError:
+            pass
+    assert ModeSpec("chaves", template="{{literal}} {goals}").render("p", goals=["g"]) == "{literal} - g"
+    print(f"  ✅ Modos: {registry.names()}")
+    
+    print("\n✓ Aplicando parâmetros do modo e ajustes do agente no GPT...")
+    
+    class ParamsProvider(providers.LLMProvider):
+        def complete(self, messages, model, temperature, max_tokens):
+            return f"{model}|{temperature}|{messages[0]['content']}"
+    
+    providers.register_provider("params", ParamsProvider())
+    gpt = GPTAgent(name="ModeGPT", routes={mode: ("params", "base") for mode in AgentMode})
+    assert registry.run(gpt, "summarize", "x").response == "resumidor|0.1|Você resume textos.\nSeja breve."
+    gpt.update_settings(model="modelo-do-agente", max_history=2)
+    assert gpt.ask("a").response.startswith("modelo-do-agente|")
+    gpt.ask("b")
+    assert [entry["prompt"] for entry in gpt.get_history()] == ["a", "b"]
+    print(f"  ✅ Ajustes do agente têm precedência e max_history limita o histórico")
+    
+    print("\n✓ Testando endpoints de modos...")
+    from fastapi.testclient import TestClient
+    import app
+    client = TestClient(app.app)
+    assert client.post("/modes", json={"name": "translate", "template": "Traduza: {prompt}"}).status_code == 200
+    assert client.post("/modes", json={"name": "translate"}).status_code == 400
+    assert client.post("/modes", json={"name": "quebrado", "template": "{prompt.upper}"}).status_code == 400
+    assert client.post("/modes", json={"name": "quente", "temperature": 5}).status_code == 422
+    assert "translate" in [mode["name"] for mode in client.get("/modes").json()["modes"]]
+    body = client.post("/agent/ModeAPI/run/translate", json={"prompt": "olá"}).json()
+    assert body["mode"] == "translate" and body["response"] == "Traduza: olá"
+    assert client.post("/agent/ModeAPI/run/plan", json={"prompt": "p", "goals": ["g"]}).json()["metadata"]["goals_count"] == 1
+    assert client.post("/agent/ModeAPI/run/inexistente", json={"prompt": "x"}).status_code == 404
+    settings = client.put("/agent/ModeAPI/settings", json={"max_history": 1}).json()["settings"]
+    assert settings == {"max_history": 1}
+    assert client.get("/agent/ModeAPI").json()["history_size"] == 1
+    for invalid in ({"max_history": 0}, {"max_history": -1}, {"temperature": -0.5}, {"max_tokens": 0}):
+        assert client.put("/agent/ModeAPI/settings", json=invalid).status_code == 422
+    assert client.get("/agent/ModeAPI").json()["settings"] == {"max_history": 1}
+    app.agents.clear()
+    print(f"  ✅ Registro, despacho genérico e ajustes via API")
+    
+    print("\n✅ Testes de registro de modos passaram!")
+    return True
+
+
+def test_websocket_session():
+    """Testa a sessão WebSocket com streaming e multiplexação"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Sessão WebSocket")
+    print("="*70)
+    
+    import providers
+    from llm_agent import GPTAgent
+    from fastapi.testclient import TestClient
+    from starlette.websockets import WebSocketDisconnect
+    import app
+    
+    class StreamingProvider(providers.LLMProvider):
+        def complete(self, messages, model, temperature, max_tokens):
+            return "".join(self.stream(messages, model, temperature, max_tokens))
+        
+        def stream(self, messages, model, temperature, max_tokens):
+            for word in messages[-1]["content"].split():
+                yield word + " "
+    
+    providers.register_provider("streaming", StreamingProvider())
+    app.agents["WSAgent"] = GPTAgent(name="WSAgent", routes={mode: ("streaming", "m") for mode in AgentMode})
+    client = TestClient(app.app)
+    
+    print("\n✓ Multiplexando requisições na mesma conexão...")
+    with client.websocket_connect("/agent/WSAgent/ws") as ws:
+        ws.send_json({"id": "a", "mode": "ask", "prompt": "um dois três"})
+        ws.send_json({"id": "b", "mode": "plan", "prompt": "quatro cinco", "goals": ["seis"]})
+        ws.send_json({"id": "c", "mode": "inexistente", "prompt": "x"})
+        chunks, done, errors = {"a": [], "b": []}, {}, {}
+        while len(done) + len(errors) < 3:
+            message = ws.receive_json()
+            if message["type"] == "chunk":
+                chunks[message["id"]].append(message["data"])
+            elif message["type"] == "done":
+                done[message["id"]] = message["response"]
+            else:
+                errors[message["id"]] = message["detail"]
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+    assert "".join(chunks["a"]) == done["a"]["response"] == "um dois três "
+    assert len(chunks["b"]) > 1 and done["b"]["metadata"]["goals_count"] == 1
+    assert "c" in errors
+    assert len(app.agents["WSAgent"].get_history()) == 2
+    print(f"  ✅ {len(chunks['a']) + len(chunks['b'])} pedaços em 2 respostas multiplexadas")
+    
+    print("\n✓ Respondendo mensagens inválidas com frames de erro...")
+    with client.websocket_connect("/agent/WSAgent/ws") as ws:
+        invalid = [
+            [1, 2],
+            "texto",
+            {"id": "int", "prompt": 5},
+            {"id": "goals", "mode": "plan", "prompt": "p", "goals": "não é lista"},
+            {"id": "mode", "mode": ["ask"], "prompt": "p"},
+            {"id": "type", "type": "desconhecido", "prompt": "p"},
+            {"id": "gpt", "prompt": "p", "use_gpt": True},
+            {"id": {"aninhado": True}, "prompt": None}
+        ]
+        for message in invalid:
+            ws.send_json(message)
+            reply = ws.receive_json()
+            assert reply["type"] == "error", (message, reply)
+        assert reply["id"] is None
+        ws.send_json({"id": "ok", "prompt": "ainda funciona"})
+        while (reply := ws.receive_json())["type"] == "chunk":
+            pass
+        assert reply["type"] == "done" and reply["id"] == "ok"
+    assert len(app.agents["WSAgent"].get_history()) == 3
+    assert client.get("/history/export").status_code == 200
+    print(f"  ✅ {len(invalid)} mensagens inválidas rejeitadas sem derrubar a sessão")
+    
+    print("\n✓ Resolvendo o agente da sessão fora do event loop...")
+    import httpx
+    from websockets.sync.client import connect
+    original_get_or_create = app.get_or_create_agent
+    
+    def slow_get_or_create(agent_name, use_gpt=False):
+        # Simula a primeira importação de llm_agent/openai
+        time.sleep(0.5)
+        return original_get_or_create(agent_name, use_gpt)
+    
+    app.get_or_create_agent = slow_get_or_create
+    try:
+        with UvicornThread(app.app) as server:
+            opened = threading.Thread(
+                target=lambda: connect(server.url.replace("http", "ws") + "/agent/WSLento/ws").close()
+            )
+            opened.start()
+            time.sleep(0.1)
+            started = time.monotonic()
+            assert httpx.get(server.url + "/health", timeout=5).status_code == 200
+            health_latency = time.monotonic() - started
+            opened.join(timeout=5)
+    finally:
+        app.get_or_create_agent = original_get_or_create
+    assert health_latency < 0.3, health_latency
+    print(f"  ✅ /health respondeu em {health_latency * 1000:.0f} ms durante a criação do agente")
+    
+    print("\n✓ Testando SimpleAgent e timeout de ociosidade...")
+    idle_timeout = app.WS_IDLE_TIMEOUT_SECONDS
+    app.WS_IDLE_TIMEOUT_SECONDS = 0.2
+    try:
+        with client.websocket_connect("/agent/WSSimple/ws") as ws:
+            ws.send_json({"id": 1, "mode": "study", "prompt": "IA"})
+            assert "ANÁLISE DETALHADA" in ws.receive_json()["data"]
+            assert ws.receive_json()["type"] == "done"
+            try:
+                ws.receive_json()
+                assert False, "sessão ociosa deveria ser encerrada"
+            except WebSocketDisconnect as e:
+                assert e.code == 1000
+    finally:
+        app.WS_IDLE_TIMEOUT_SECONDS = idle_timeout
+    app.agents.clear()
+    print(f"  ✅ Sessão ociosa encerrada")
+    
+    print("\n✅ Testes de WebSocket passaram!")
+    return True
+
+
+def test_history_export_import():
+    """Testa a exportação/importação colunar do histórico"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Exportação Colunar do Histórico")
+    print("="*70)
+    
+    import history_io
+    
+    agents = {name: SimpleAgent(name=name) for name in ("A", "B")}
+    for i in range(5):
+        agents["A"].ask(f"pergunta {i}")
+    agents["B"].plan("plano", goals=["x"])
+    
+    try:
+        import pyarrow
+        formats = ["jsonl", "parquet"]
+    except ImportError:
+        formats = ["jsonl"]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in formats:
+            print(f"\n✓ Exportando em {fmt} com blocos de 4 linhas...")
+            path = os.path.join(tmp, f"historico.{fmt}")
+            stats = history_io.export_history(agents, path, chunk_size=4)
+            assert stats["rows"] == 6 and stats["chunks"] == 2
+            chunks = list(history_io.read_chunks(path))
+            assert chunks[0]["agent"] == ["A"] * 4
+            assert chunks[1]["mode"] == ["ask", "plan"]
+            assert all(tokens > 0 for tokens in chunks[1]["response_tokens"])
+            print(f"  ✅ {stats['rows']} linhas em {stats['chunks']} blocos")
+            
+            print(f"\n✓ Importando {fmt} em agentes novos...")
+            restored = {}
+            rows = history_io.import_chunks(
+                history_io.read_chunks(path),
+                lambda name: restored.setdefault(name, SimpleAgent(name=name))
+            )
+            assert rows == 6
+            assert restored["A"].get_history() == agents["A"].get_history()
+            assert restored["B"].get_history() == agents["B"].get_history()
+            print(f"  ✅ Histórico restaurado com timestamps")
+        
+        print("\n✓ Exportação incremental pela marca d'água...")
+        time.sleep(0.01)
+        agents["B"].ask("nova")
+        path = os.path.join(tmp, "incremental.jsonl")
+        incremental = history_io.export_history(agents, path, since=stats["watermark"], include_text=False)
+        chunk = next(history_io.read_chunks(path))
+        assert incremental["rows"] == 1 and chunk["agent"] == ["B"] and "prompt" not in chunk
+        print(f"  ✅ Apenas a entrada nova exportada")
+        
+        print("\n✓ Preservando entradas provisórias na exportação...")
+        drafts = {"D": SimpleAgent(name="D")}
+        entry = drafts["D"].add_to_history("plan", "rascunho", "esqueleto", provisional=True)
+        drafts["D"].ask("definitiva")
+        path = os.path.join(tmp, "provisorio.jsonl")
+        history_io.export_history(drafts, path)
+        assert next(history_io.read_chunks(path))["provisional"] == [True, False]
+        restored = {}
+        history_io.import_chunks(history_io.read_chunks(path), lambda name: restored.setdefault(name, SimpleAgent(name=name)))
+        assert restored["D"].get_history() == drafts["D"].get_history()
+        watermark = time.time()
+        time.sleep(0.01)
+        drafts["D"].replace_history_entry(entry, "refinado")
+        incremental = history_io.export_history(drafts, path, since=watermark)
+        assert incremental["rows"] == 1 and next(history_io.read_chunks(path))["response"] == ["refinado"]
+        print(f"  ✅ Flag provisional exportada e substituição incluída na exportação incremental")
+        
+        print("\n✓ Rejeitando blocos inválidos...")
+        valid = {"agent": ["A"], "mode": ["ask"], "timestamp": [1.0], "prompt": ["p"], "response": ["r"]}
+        invalid_chunks = [
+            [1, 2],
+            {**valid, "prompt": "p"},
+            {**valid, "response": ["r", "s"]},
+            {**valid, "prompt": [5]},
+            {**valid, "timestamp": ["ontem"]},
+            {**valid, "provisional": ["sim"]},
+            {key: value for key, value in valid.items() if key != "mode"}
+        ]
+        for invalid in invalid_chunks:
+            target = SimpleAgent(name="Alvo")
+            try:
+                history_io.import_chunks([invalid], lambda name: target)
+                assert False, f"bloco aceito: {invalid}"
+            except ValueError:
+                pass
+            assert target.get_history() == []
+        print(f"  ✅ {len(invalid_chunks)} blocos inválidos rejeitados sem importar nada")
+    
+    print("\n✓ Exportando e importando via API...")
+    from fastapi.testclient import TestClient
+    import app
+    client = TestClient(app.app)
+    app.agents.clear()
+    app.agents.update(agents)
+    exported = client.get("/history/export", params={"chunk_size": 2})
+    assert exported.status_code == 200 and float(exported.headers["X-History-Watermark"]) > 0
+    body = exported.content
+    assert len(body.splitlines()) == 4
+    if "parquet" in formats:
+        assert client.get("/history/export", params={"format": "arrow"}).status_code == 200
+    app.agents.clear()
+    assert client.post("/history/import", content=body).json()["rows"] == 7
+    app.agents.clear()
+    # Leituras pequenas da rede, com linhas partidas entre elas
+    pieces = iter([body[i:i + 7] for i in range(0, len(body), 7)])
+    assert client.post("/history/import", content=pieces).json()["rows"] == 7
+    assert len(app.agents["A"].get_history()) == 5
+    for invalid in (b"[1, 2]\n", b'{"agent": "A", "mode": "ask", "timestamp": 1, "prompt": 5, "response": "r"}\n'):
+        assert client.post("/history/import", content=invalid).status_code == 400
+    app.agents.clear()
+    print(f"  ✅ Exportação em streaming e importação em massa")
+    
+    print("\n✅ Testes de exportação colunar passaram!")
+    return True
+
+
+def test_http_caching():
+    """Testa compressão negociada e ETag/If-None-Match"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Compressão e ETags")
+    print("="*70)
+    
+    import gzip
+    from fastapi.testclient import TestClient
+    import app
+    from compression import negotiate_encoding
+    
+    client = TestClient(app.app)
+    app.agents.clear()
+    client.post("/agent/create", json={"agent_name": "painel"})
+    for i in range(10):
+        client.post("/agent/painel/study", json={"prompt": f"tópico {i}"})
+    
+    print("\n✓ Negociando codificação...")
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("") is None
+    print(f"  ✅ Accept-Encoding respeitado (q=0 recusa)")
+    
+    print("\n✓ Comprimindo acima do tamanho mínimo...")
+    plain = client.get("/agent/painel/history", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    with client.stream("GET", "/agent/painel/history", headers={"Accept-Encoding": "gzip"}) as compressed:
+        raw = b"".join(compressed.iter_raw())
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(raw)) == plain.json()
+    assert len(raw) < len(plain.content)
+    small = client.get("/agent/list", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    print(f"  ✅ {len(plain.content)} → {len(raw)} bytes; respostas pequenas sem compressão")
+    
+    print("\n✓ Revalidando com If-None-Match...")
+    for url in ("/agent/painel/history", "/agent/painel", "/agent/list"):
+        first = client.get(url)
+        etag = first.headers["ETag"]
+        again = client.get(url, headers={"If-None-Match": etag})
+        assert again.status_code == 304 and again.content == b""
+    
+    history_etag = client.get("/agent/painel/history").headers["ETag"]
+    client.post("/agent/painel/ask", json={"prompt": "nova"})
+    changed = client.get("/agent/painel/history", headers={"If-None-Match": history_etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != history_etag
+    
+    list_etag = client.get("/agent/list").headers["ETag"]
+    client.delete("/agent/painel")
+    client.post("/agent/create", json={"agent_name": "painel"})
+    assert client.get("/agent/list", headers={"If-None-Match": list_etag}).status_code == 200
+    assert client.get("/agent/painel/history", headers={"If-None-Match": history_etag}).status_code == 200
+    app.agents.clear()
+    print(f"  ✅ 304 sem corpo enquanto a versão não muda")
+    
+    print("\n✅ Testes de compressão e ETags passaram!")
+    return True
+
+
+def test_text_store():
+    """Testa o compartilhamento dos textos do histórico"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Textos Compartilhados no Histórico")
+    print("="*70)
+    
+    from text_store import TextStore, text_store
+    
+    print("\n✓ Contando referências...")
+    store = TextStore()
+    first = store.intern("".join(["texto ", "repetido"]))
+    second = store.intern("".join(["texto ", "repetido"]))
+    assert first is second
+    assert store.stats()["unique_texts"] == 1 and store.stats()["dedup_ratio"] == 2.0
+    store.release(first)
+    assert store.stats()["unique_texts"] == 1
+    store.release(second)
+    assert store.stats() == TextStore().stats()
+    print(f"  ✅ Texto liberado ao perder a última referência")
+    
+    print("\n✓ Compartilhando entre agentes...")
+    import gc
+    gc.collect()
+    before = text_store.stats()["unique_texts"]
+    agents = [SimpleAgent(name=f"dedup_{i}") for i in range(5)]
+    responses = [agent.study("".join(["tópico ", "compartilhado"])) for agent in agents for _ in range(3)]
+    histories = [agent.get_history() for agent in agents]
+    assert all(entry["response"] is histories[0][0]["response"] for history in histories for entry in history)
+    assert text_store.stats()["unique_texts"] == before + 2
+    print(f"  ✅ 15 entradas, 2 textos armazenados")
+    
+    print("\n✓ Liberando em max_history, clear_history e descarte do agente...")
+    agents[0].update_settings(max_history=1)
+    agents[1].clear_history()
+    assert text_store.stats()["unique_texts"] == before + 2
+    del agents[2:], histories, responses
+    gc.collect()
+    assert len(agents[0].get_history()) == 1
+    assert text_store.stats()["unique_texts"] == before + 2
+    agents.clear()
+    gc.collect()
+    assert text_store.stats()["unique_texts"] == before
+    print(f"  ✅ Nenhum texto retido após remover os agentes")
+    
+    print("\n✓ Consultando /metrics/history e DELETE do agente...")
+    from fastapi.testclient import TestClient
+    import app
+    client = TestClient(app.app)
+    client.post("/agent/create", json={"agent_name": "dedup_api"})
+    client.post("/agent/dedup_api/ask", json={"prompt": "pergunta única do teste"})
+    metrics = client.get("/metrics/history").json()
+    assert metrics["unique_texts"] == before + 2 and metrics["dedup_ratio"] >= 1
+    client.delete("/agent/dedup_api")
+    assert client.get("/metrics/history").json()["unique_texts"] == before
+    print(f"  ✅ Razão de deduplicação: {metrics['dedup_ratio']}")
+    
+    print("\n✅ Testes de textos compartilhados passaram!")
+    return True
+
+
+def test_stub_llm():
+    """Testa o servidor LLM simulado e o GPTAgent apontado para ele"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Stub LLM Local")
+    print("="*70)
+    
+    import random
+    from fastapi.testclient import TestClient
+    from stub_llm import StubLLM, StubServer, LatencyDistribution
+    from providers import HTTPChatProvider, register_provider
+    from llm_agent import GPTAgent
+    
+    body = {"model": "stub", "messages": [{"role": "user", "content": "Olá"}], "max_tokens": 8}
+    
+    print("\n✓ Repetindo a sequência com a mesma semente...")
+    sequences = []
+    for _ in range(2):
+        client = TestClient(StubLLM(error_rate=0.3, error_statuses=(500, 429), seed=7).app)
+        sequences.append([
+            (response.status_code, response.json().get("choices"))
+            for response in (client.post("/v1/chat/completions", json=body) for _ in range(20))
+        ])
+    assert sequences[0] == sequences[1]
+    statuses = {status for status, _ in sequences[0]}
+    assert 200 in statuses and statuses & {500, 429}
+    choices = next(choices for status, choices in sequences[0] if status == 200)
+    assert choices[0]["finish_reason"] == "length" and len(choices[0]["message"]["content"].split()) == 8
+    latency = LatencyDistribution("normal:200:50")
+    samples = [latency.sample(random.Random(seed)) for seed in range(50)]
+    assert all(sample >= 0 for sample in samples) and 0.15 < sum(samples) / len(samples) < 0.25
+    print(f"  ✅ Erros injetados {sorted(statuses)} e latências determinísticos")
+    
+    print("\n✓ Streaming SSE a uma taxa de tokens...")
+    client = TestClient(StubLLM(tokens_per_second=200).app)
+    start = time.perf_counter()
+    response = client.post("/v1/chat/completions", json={**body, "stream": True})
+    elapsed = time.perf_counter() - start
+    events = [line[6:] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    deltas = [json.loads(event)["choices"][0]["delta"].get("content", "") for event in events[:-1]]
+    assert len([delta for delta in deltas if delta]) == 8 and elapsed >= 8 / 200
+    print(f"  ✅ {len(deltas)} eventos em {elapsed * 1000:.0f} ms")
+    
+    with tempfile.TemporaryDirectory() as tmp, StubServer(StubLLM(latency="fixed:20")) as upstream:
+        print("\n✓ GPTAgent apontado para o stub...")
+        register_provider("stub", HTTPChatProvider(base_url=upstream.base_url))
+        agent = GPTAgent(name="stub", routes={mode: ("stub", "modelo-stub") for mode in AgentMode})
+        answer = agent.ask("Qual é a capital do Brasil?")
+        assert answer.response.startswith("Resposta simulada para: Qual é a capital do Brasil?")
+        chunks = []
+        streamed = agent.stream(AgentMode.PLAN, "Aprender Python", goals=["POO"], on_chunk=chunks.append)
+        assert len(chunks) > 1 and "".join(chunks) == streamed.response
+        print(f"  ✅ ask e plan em streaming via HTTPChatProvider")
+        
+        print("\n✓ Gravando e reproduzindo trocas...")
+        cassette = os.path.join(tmp, "gravacoes.jsonl")
+        recorder = TestClient(StubLLM(mode="record", cassette=cassette, upstream_url=upstream.base_url).app)
+        recorded = recorder.post("/v1/chat/completions", json=body).json()["choices"][0]["message"]["content"]
+        replayer = TestClient(StubLLM(mode="replay", cassette=cassette, latency="recorded").app)
+        replayed = replayer.post("/v1/chat/completions", json=body).json()["choices"][0]["message"]["content"]
+        assert replayed == recorded
+        assert replayer.post("/v1/chat/completions", json={**body, "max_tokens": 9}).status_code == 404
+        assert replayer.get("/stub/stats").json()["replay_misses"] == 1
+        print(f"  ✅ Resposta reproduzida do cassette; requisições não gravadas recebem 404")
+    
+    print("\n✅ Testes do stub LLM passaram!")
+    return True
+
+
+def test_graceful_shutdown():
+    """Testa a drenagem no encerramento e o estado recarregado na inicialização"""
+    print("\n" + "="*70)
+    print("🧪 TESTE: Encerramento Gracioso e Estado Persistido")
+    print("="*70)
+    
+    import asyncio
+    from fastapi.testclient import TestClient
+    from lifecycle import Drainer, DrainMiddleware
+    from router import get_stats
+    import app
+    
+    print("\n✓ Drenando requisições em andamento...")
+    async def drain_scenario():
+        drainer = Drainer()
+        release = asyncio.Event()
+        
+        async def slow_app(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+        
+        middleware = DrainMiddleware(slow_app, drainer)
+        sent = []
+        
+        async def send(message):
+            sent.append(message)
+        
+        in_flight = asyncio.create_task(middleware({"type": "http"}, None, send))
+        await asyncio.sleep(0.01)
+        drainer.begin()
+        await middleware({"type": "http"}, None, send)
+        assert sent[0]["status"] == 503 and drainer.in_flight == 1
+        assert not await drainer.wait_idle(0.05)
+        release.set()
+        assert await drainer.wait_idle(1)
+        await in_flight
+        assert sent[-1]["status"] == 200
+    
+    asyncio.run(drain_scenario())
+    print(f"  ✅ Novas requisições recebem 503; as em andamento terminam")
+    
+    original_state = (app.STATE_DIR, app.STATE_MAX_AGENTS)
+    with tempfile.TemporaryDirectory() as tmp:
+        app.STATE_DIR, app.STATE_MAX_AGENTS = tmp, 2
+        app.agents.clear()
+        try:
+            print("\n✓ Encerrando com um job em andamento...")
+            with TestClient(app.app) as client:
+                for name in ("antigo", "recente", "ativo"):
+                    client.post("/agent/create", json={"agent_name": name, "settings": {"max_history": 5}})
+                    client.post(f"/agent/{name}/ask", json={"prompt": f"pergunta de {name}"})
+                    time.sleep(0.01)
+                client.get("/agent/recente")
+                get_stats(AgentMode.ASK, "stub", "persistido").record(120.0, True)
+                job = app.job_manager.submit(
+                    lambda: (time.sleep(0.2), {"ok": True})[1], agent_name="ativo", mode="ask", prompt="lento"
+                )
+            assert job.status == "done"
+            assert set(os.listdir(tmp)) == {"agents.json", "history.jsonl", "router.json"}
+            print(f"  ✅ Job concluído antes de gravar o estado")
+            
+            print("\n✓ Recarregando os agentes mais recentes...")
+            saved_history = app.agents["recente"].get_history()
+            app.agents.clear()
+            with TestClient(app.app) as client:
+                assert sorted(client.get("/agent/list").json()["agents"]) == ["ativo", "recente"]
+                assert client.get("/agent/recente/history").json()["history"] == saved_history
+                assert client.get("/agent/recente").json()["settings"] == {"max_history": 5}
+            with open(os.path.join(tmp, "router.json")) as f:
+                assert any(item["mode"] == "ask" and item["model"] == "persistido" for item in json.load(f))
+            print(f"  ✅ Agentes, histórico, ajustes e estatísticas do roteador restaurados")
+            
+            print("\n✓ Encerrando um uvicorn real dentro de um prazo único...")
+            import httpx
+            import providers
+            from llm_agent import GPTAgent
+            
+            stuck = threading.Event()
+            
+            class BlockingProvider(providers.LLMProvider):
+                def complete(self, messages, model, temperature, max_tokens):
+                    if "rápida" in messages[-1]["content"]:
+                        time.sleep(0.5)
+                        return "resposta rápida"
+                    stuck.wait(10)
+                    return "resposta travada"
+            
+            providers.register_provider("blocking", BlockingProvider())
+            app.agents.clear()
+            app.agents["Lento"] = GPTAgent(name="Lento", routes={mode: ("blocking", "m") for mode in AgentMode})
+            original_budget = (app.drainer.timeout, app.drainer.reserve)
+            app.drainer.timeout, app.drainer.reserve = 2.0, 0.5
+            results = {}
+            
+            def request(prompt):
+                with httpx.Client(base_url=server.url, timeout=10) as http:
+                    try:
+                        results[prompt] = http.post("/agent/Lento/ask", json={"prompt": prompt}).status_code
+                    except httpx.HTTPError as e:
+                        results[prompt] = type(e).__name__
+            
+            try:
+                with UvicornThread(app.app, drainer=app.drainer) as server:
+                    job = app.job_manager.submit(lambda: stuck.wait(10) and {}, agent_name="Lento", mode="ask", prompt="job")
+                    requests_ = [threading.Thread(target=request, args=(prompt,)) for prompt in ("rápida", "travada")]
+                    for thread in requests_:
+                        thread.start()
+                    while app.drainer.in_flight < 2:
+                        time.sleep(0.01)
+                    started = time.monotonic()
+                    server.server.should_exit = True
+                    while not app.drainer.draining:
+                        time.sleep(0.01)
+                    # Drenando já durante a espera de conexões do uvicorn
+                    assert app.drainer.in_flight == 2
+                    server.thread.join(timeout=10)
+                    elapsed = time.monotonic() - started
+                    assert not server.thread.is_alive()
+            finally:
+                stuck.set()
+                for thread in requests_:
+                    thread.join(timeout=5)
+                app.drainer.timeout, app.drainer.reserve = original_budget
+            assert results["rápida"] == 200 and results["travada"] != 200
+            assert job.status == "cancelled"
+            # Espera de conexões limitada a prazo - reserva; jobs e gravação no que sobra
+            assert 1.3 < elapsed < 2.3, elapsed
+            with open(os.path.join(tmp, "history.jsonl")) as f:
+                saved = [json.loads(line) for line in f]
+            lento = [prompt for chunk in saved for agent, prompt in zip(chunk["agent"], chunk["prompt"]) if agent == "Lento"]
+            assert lento == ["rápida"]
+            print(f"  ✅ Encerramento em {elapsed:.2f}s (prazo 2s): requisição rápida concluída e gravada, "
+                  f"travada e job cortados no prazo")
+        finally:
+            app.STATE_DIR, app.STATE_MAX_AGENTS = original_state
+            app.agents.clear()
+    
+    print("\n✅ Testes de encerramento gracioso passaram!")
+    return True
+
+
 def run_all_tests():
     """Executa todos os testes"""
     print("\n")
@@ -147,7 +1396,23 @@ def run_all_tests():
         test_agent_modes,
         test_simple_agent,
         test_response_structure,
-        test_multiple_agents
+        test_multiple_agents,
+        test_concurrent_history,
+        test_concurrent_agent_creation,
+        test_bulk_runner,
+        test_job_manager,
+        test_lazy_backends,
+        test_llm_providers,
+        test_model_router,
+        test_speculative_response,
+        test_prompt_assembly,
+        test_mode_registry,
+        test_websocket_session,
+        test_history_export_import,
+        test_http_caching,
+        test_text_store,
+        test_stub_llm,
+        test_graceful_shutdown
     ]
     
     passed = 0
@@ -0,0 +1,70 @@
+"""
+Armazenamento compartilhado dos textos do histórico
+Prompts e respostas idênticos (ex.: respostas padrão do SimpleAgent, a
+mesma pergunta feita a vários agentes) são guardados uma única vez e as
+entradas do histórico apontam para a mesma instância de str.
+"""
+
+import sys
+import threading
+from typing import Dict, Any
+
+
+class TextStore:
+    """
+    Textos endereçados pelo conteúdo, com contagem de referências
+
+    A chave é o próprio texto (o hash de str é calculado uma vez e fica em
+    cache no objeto); cada intern soma uma referência e cada release
+    subtrai, liberando o texto quando ninguém mais o usa.
+    """
+
+    def __init__(self):
+        # texto -> [instância compartilhada, referências]
+        self._texts: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._stored_bytes = 0
+        self._logical_bytes = 0
+        self._references = 0
+
+    def intern(self, text: str) -> str:
+        """Registra uma referência e retorna a instância compartilhada"""
+        size = sys.getsizeof(text)
+        with self._lock:
+            slot = self._texts.get(text)
+            if slot is None:
+                slot = self._texts[text] = [text, 0]
+                self._stored_bytes += size
+            slot[1] += 1
+            self._references += 1
+            self._logical_bytes += size
+            return slot[0]
+
+    def release(self, text: str):
+        """Remove uma referência; textos sem referências são descartados"""
+        size = sys.getsizeof(text)
+        with self._lock:
+            slot = self._texts.get(text)
+            if slot is None:
+                return
+            slot[1] -= 1
+            self._references -= 1
+            self._logical_bytes -= size
+            if slot[1] == 0:
+                del self._texts[text]
+                self._stored_bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Textos únicos, referências e a razão de deduplicação (lógico/armazenado)"""
+        with self._lock:
+            return {
+                "unique_texts": len(self._texts),
+                "references": self._references,
+                "stored_bytes": self._stored_bytes,
+                "logical_bytes": self._logical_bytes,
+                "dedup_ratio": round(self._logical_bytes / self._stored_bytes, 2) if self._stored_bytes else 1.0
+            }
+
+
+# Compartilhado por todos os agentes do processo
+text_store = TextStore()